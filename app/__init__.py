@@ -1,2 +0,0 @@
-import nest_asyncio
-nest_asyncio.apply()
@@ -1,66 +1,64 @@
 import asyncio
 import logging
+import os
 import uvicorn
 
 import coloredlogs
 
 from app import db
 from app.arguments import parse_arguments
-from app.config import Config, parse_config
-from app.db import close_orm, init_orm
-
-from app.dispatcher import dispatcher
+from app.config import Config, config_watcher, load_config
 
 from datetime import datetime
 
 
-async def on_startup(
-    disp, config: Config, **kwargs
-):
+async def migrate(config: Config, check: bool = True):
     tortoise_config = config.database.get_tortoise_config()
-    await init_orm(tortoise_config)
-
-    web_config = config.web.get_config()
-
-    logging.error("Started!")
-
-    uvicorn.run(
-        disp,
-        host=web_config["host"],
-        port=web_config["port"]
-    )
-
+    if check and await db.schema_is_current(tortoise_config):
+        logging.info("Database schema is up to date, skipping migrations")
+    else:
+        try:
+            await db.create_models(tortoise_config)
+        except FileExistsError:
+            await db.migrate_models(tortoise_config)
+    await db.close_orm()
 
-async def on_shutdown():
-    logging.warning("Stopping...")
-    await close_orm()
 
-
-async def main():
+def main():
     coloredlogs.install(level=logging.INFO)
     logging.warning("Starting...")
 
     arguments = parse_arguments()
-    config = parse_config(arguments.config)
+    config = load_config(arguments.config)
 
-    tortoise_config = config.database.get_tortoise_config()
-    try:
-        await db.create_models(tortoise_config)
-    except FileExistsError:
-        await db.migrate_models(tortoise_config)
+    if arguments.command == "migrate":
+        asyncio.run(migrate(config, check=False))
+        logging.warning("Migrated!")
+        return
 
-    start_time = datetime.now()
+    # migrate once, before workers start, only if models changed
+    asyncio.run(migrate(config))
 
-    context_kwargs = {"start_time": start_time}
+    # workers build the app themselves with app.dispatcher.create_app
+    os.environ["LIMOKA_CONFIG"] = os.path.abspath(config_watcher.config_file)
+    os.environ["LIMOKA_START_TIME"] = datetime.now().isoformat()
 
-    disp = dispatcher(context_kwargs)
+    web_config = config.web.get_config()
 
-    await on_startup(disp, config, **context_kwargs)
+    logging.error("Started!")
+
+    uvicorn.run(
+        "app.dispatcher:create_app",
+        factory=True,
+        host=web_config["host"],
+        port=web_config["port"],
+        workers=web_config["workers"],
+    )
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        main()
     except (KeyboardInterrupt, SystemExit):
-        asyncio.run(on_shutdown())
-        logging.error("Stopped!")
+        pass
+    logging.error("Stopped!")
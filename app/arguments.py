@@ -3,6 +3,10 @@ import argparse
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Process app configuration.")
+    parser.add_argument(
+        "command", nargs="?", choices=["serve", "migrate"], default="serve",
+        help="serve api (default) or only migrate database",
+    )
     parser.add_argument(
         "--config", "-c", type=str, help="configuration file", default="config.toml"
     )
@@ -1,6 +1,9 @@
 # sourcery skip: avoid-builtin-shadow
+import logging
 import os
+import time
 from dataclasses import MISSING, dataclass, fields
+from typing import Optional
 
 import toml
 
@@ -8,11 +11,16 @@ import toml
 class ConfigWeb:
     host: str
     port: int
+    # seconds between build info refreshes for the root endpoint
+    info_interval: float = 300
+    # server processes, each one has its own database pool and caches
+    workers: int = 1
 
     def get_config(self):
         return {
             "host": self.host,
             "port": self.port,
+            "workers": self.workers,
         }
 
 
@@ -34,11 +42,14 @@ class ConfigDatabase:
     password: str = None
     host: str = None
     port: str = None
+    # connection pool size per worker, not used by sqlite
+    minsize: int = 1
+    maxsize: int = 10
 
     def get_db_url(self):
         if self.protocol == "sqlite":
             return f"{self.protocol}://{self.file_name}"
-        return f"{self.protocol}://{self.user}:{self.password}@{self.host}:{self.port}"
+        return f"{self.protocol}://{self.user}:{self.password}@{self.host}:{self.port}?minsize={self.minsize}&maxsize={self.maxsize}"
 
     def get_tortoise_config(self):
         return {
@@ -51,11 +62,154 @@ class ConfigDatabase:
             },
         }
 
+@dataclass
+class ConfigCrawler:
+    concurrency: int = 32
+    per_host: int = 8
+    timeout: float = 15
+    retries: int = 3
+    # seconds between scheduled crawls, 0 disables schedule
+    interval: float = 0
+    # only one worker process crawls at a time
+    lock_file: str = "crawl.lock"
+    # "http" fetches raw files, "git" keeps shallow bare mirrors of repositories
+    backend: str = "http"
+    mirror_path: str = "mirrors"
+
+    def get_config(self):
+        return {
+            "concurrency": self.concurrency,
+            "per_host": self.per_host,
+            "timeout": self.timeout,
+            "retries": self.retries,
+            "backend": self.backend,
+            "mirror_path": self.mirror_path,
+        }
+
+
+@dataclass
+class ConfigParser:
+    # parser processes, 0 means one per cpu
+    workers: int = 0
+    max_size: int = 1024 * 1024
+    timeout: float = 10
+    cache_size: int = 4096
+
+    def get_config(self):
+        return {
+            "workers": self.workers,
+            "max_size": self.max_size,
+            "timeout": self.timeout,
+            "cache_size": self.cache_size,
+        }
+
+
+@dataclass
+class ConfigDiff:
+    # max diff lines per page
+    page_lines: int = 2000
+
+    def get_config(self):
+        return {
+            "page_lines": self.page_lines,
+        }
+
+
+@dataclass
+class ConfigCache:
+    enabled: bool = True
+    maxsize: int = 1024
+    ttl: float = 300
+
+    def get_config(self):
+        return {
+            "enabled": self.enabled,
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+        }
+
+
+@dataclass
+class ConfigStorage:
+    # keep module code in content-addressed blob store instead of database rows
+    blobs: bool = False
+    path: str = "blobs"
+
+    def get_config(self):
+        return {
+            "blobs": self.blobs,
+            "path": self.path,
+        }
+
+
+@dataclass
+class ConfigDownloads:
+    # seconds between writes of download counts
+    flush_interval: float = 30
+    # seconds between popular ranking rebuilds
+    ranking_interval: float = 300
+    # ranking windows in days, 0 is all time
+    windows: list = None
+    top: int = 100
+
+    def get_config(self):
+        return {
+            "flush_interval": self.flush_interval,
+            "ranking_interval": self.ranking_interval,
+            "windows": self.windows if self.windows is not None else [1, 7, 30, 0],
+            "top": self.top,
+        }
+
+
+@dataclass
+class ConfigCatalog:
+    # seconds between checks of modules revision, the snapshot is rebuilt
+    # only when it moved, which picks up changes made by other workers
+    interval: float = 60
+
+    def get_config(self):
+        return {
+            "interval": self.interval,
+        }
+
+
+@dataclass
+class ConfigCoalesce:
+    # routes where concurrent identical requests share one computation:
+    # "all", "get_diff", "download", None for all of them
+    routes: list = None
+
+    def get_config(self):
+        return {
+            "routes": self.routes,
+        }
+
+
+@dataclass
+class ConfigMetrics:
+    # request, database and crawler metrics at /metrics
+    enabled: bool = True
+
+    def get_config(self):
+        return {
+            "enabled": self.enabled,
+        }
+
+
 @dataclass
 class Config:
     web: ConfigWeb
     database: ConfigDatabase
     token: ConfigToken
+    crawler: ConfigCrawler
+    parser: ConfigParser
+    diff: ConfigDiff
+    cache: ConfigCache
+    storage: ConfigStorage
+    downloads: ConfigDownloads
+    catalog: ConfigCatalog
+    coalesce: ConfigCoalesce
+    metrics: ConfigMetrics
 
     @classmethod
     def parse(cls, data: dict) -> "Config":
@@ -63,7 +217,7 @@ class Config:
 
         for section in fields(cls):
             pre = {}
-            current = data[section.name]
+            current = data.get(section.name, {})
 
             for field in fields(section.type):
                 if field.name in current:
@@ -91,3 +245,79 @@ def parse_config(config_file: str = "config.toml") -> Config:
         data = toml.load(f)
 
     return Config.parse(dict(data))
+
+
+class ConfigWatcher:
+    """
+    Keeps parsed config in memory and reloads it when the file changes.
+    """
+    def __init__(self, config_file: str = "config.toml", check_interval: float = 1):
+        self.config_file = config_file
+        self.check_interval = check_interval
+        self.config: Optional[Config] = None
+        self.mtime = None
+        self.checked_at = 0
+
+    def get_mtime(self):
+        try:
+            return os.stat(self.config_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self, config_file: str = None) -> Config:
+        """
+        Parse config file now.
+        :param config_file: Config file, defaults to the current one.
+        :return: Config.
+        """
+        if config_file is not None:
+            self.config_file = config_file
+        if not os.path.isfile(self.config_file) and not self.config_file.endswith(".toml"):
+            self.config_file += ".toml"
+        mtime = self.get_mtime()
+        self.config = parse_config(self.config_file)
+        self.mtime = mtime
+        self.checked_at = time.monotonic()
+        return self.config
+
+    def reload(self) -> Config:
+        """
+        Reload config, the old one is kept if the new one is broken.
+        :return: Config.
+        """
+        try:
+            self.load()
+            logging.warning(f"Config reloaded from {self.config_file}")
+        except Exception as e:
+            logging.error(f"Config reload failed, keeping old config: {e!r}")
+            # do not retry until the file changes again
+            self.mtime = self.get_mtime()
+        return self.config
+
+    def get(self) -> Config:
+        """
+        Get config, reloading it if the file mtime changed.
+        The file is checked at most once per check_interval.
+        :return: Config.
+        """
+        if self.config is None:
+            return self.load()
+
+        now = time.monotonic()
+        if now - self.checked_at >= self.check_interval:
+            self.checked_at = now
+            mtime = self.get_mtime()
+            if mtime is not None and mtime != self.mtime:
+                self.reload()
+        return self.config
+
+
+config_watcher = ConfigWatcher()
+
+
+def load_config(config_file: str = "config.toml") -> Config:
+    return config_watcher.load(config_file)
+
+
+def get_config() -> Config:
+    return config_watcher.get()
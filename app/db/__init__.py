@@ -1,28 +1,90 @@
 import contextlib
 import logging
 
-from aerich import Command
-from click import Abort
 from tortoise import Tortoise
+from tortoise.exceptions import OperationalError
+
+# model, column and which duplicate to keep, rows must be unique before constraints are created
+UNIQUE_COLUMNS = (
+    ("User", "telegram_id", "first"),
+    ("Developer", "telegram_id", "first"),
+    ("Developer", "username", "first"),
+    ("Module", "name", "last"),
+)
+
+
+async def schema_is_current(tortoise_config: dict, app: str = "models") -> bool:
+    """
+    Check that the last applied migration describes the current models.
+    :param tortoise_config: Tortoise config.
+    :param app: App name.
+    :return: Is database schema up to date.
+    """
+    from aerich.coder import decoder, encoder
+    from aerich.models import Aerich
+    from aerich.utils import get_models_describe
+
+    await Tortoise.init(config=tortoise_config)
+    try:
+        last = await Aerich.filter(app=app).order_by("-id").first()
+    except OperationalError:
+        # no aerich table yet
+        return False
+    if last is None:
+        return False
+    # same json round trip as when the migration was stored
+    return last.content == decoder(encoder(get_models_describe(app)))
 
 
 async def create_models(tortoise_config: dict):
+    from aerich import Command
+
     command = Command(tortoise_config=tortoise_config, app="models")
     await command.init()
     await command.init_db(safe=True)
     await command.upgrade(run_in_transaction=True)
 
 
+async def remove_duplicates(app: str = "models"):
+    """
+    Delete rows that would break unique constraints, call it after Tortoise.init.
+    :param app: App name.
+    """
+    from pypika_tortoise import functions as fn
+
+    for model_name, column, keep in UNIQUE_COLUMNS:
+        model = Tortoise.apps[app][model_name]
+        db = model._choose_db(True)
+        table = model._meta.basetable
+        aggregate = fn.Min if keep == "first" else fn.Max
+        kept = db.query_class.from_(table).select(aggregate(table.id).as_("id")).groupby(table[column])
+        # wrapped in a derived table, mysql can't select from the table it deletes from
+        kept_ids = db.query_class.from_(kept).select(kept.id)
+        query = db.query_class.from_(table).where(table.id.notin(kept_ids)).delete()
+        try:
+            deleted = await db.execute_query(query.get_sql())
+        except OperationalError:
+            # no table yet
+            continue
+        if deleted[0]:
+            logging.warning(f"Deleted {deleted[0]} duplicate {model_name} rows by {column}")
+
+
 async def migrate_models(tortoise_config: dict):
+    from aerich import Command
+    from click import Abort
+
     command = Command(tortoise_config=tortoise_config, app="models")
     await command.init()
+    await remove_duplicates()
     with contextlib.suppress(Abort):
         await command.migrate()
     await command.upgrade(run_in_transaction=True)
 
 
 async def init_orm(tortoise_config: dict) -> None:
-    await Tortoise.init(config=tortoise_config)
+    # initialized in lifespan task, requests run in other tasks
+    await Tortoise.init(config=tortoise_config, _enable_global_fallback=True)
     logging.info(f"Tortoise-ORM started, {Tortoise.apps}")
 
 
@@ -0,0 +1,94 @@
+from cachetools import TTLCache
+
+MISSING = object()
+
+
+class CountingCache:
+    """
+    TTL cache which counts hits and misses.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.cache.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.cache[key] = value
+
+    def pop(self, key):
+        self.cache.pop(key, None)
+
+    def keys(self) -> list:
+        return list(self.cache.keys())
+
+    def clear(self):
+        self.cache.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "size": self.cache.currsize,
+            "maxsize": self.cache.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class ModuleCache:
+    """
+    Read cache for module queries, invalidated by module writes.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 300, enabled: bool = True):
+        self.configure(maxsize, ttl, enabled)
+
+    def configure(self, maxsize: int = 1024, ttl: float = 300, enabled: bool = True):
+        self.enabled = enabled
+        # listings are few but large
+        self.lists = CountingCache(maxsize=64, ttl=ttl)
+        self.by_id = CountingCache(maxsize=maxsize, ttl=ttl)
+        self.by_name = CountingCache(maxsize=maxsize, ttl=ttl)
+        self.raw = CountingCache(maxsize=maxsize, ttl=ttl)
+        # keyed by code hashes, never invalidated
+        self.diffs = CountingCache(maxsize=256, ttl=ttl)
+
+    def get(self, cache: CountingCache, key):
+        if not self.enabled:
+            return MISSING
+        return cache.get(key)
+
+    def set(self, cache: CountingCache, key, value):
+        if self.enabled:
+            cache.set(key, value)
+
+    def invalidate(self, module_id: int, name: str):
+        """
+        Drop cached entries of module and all listings.
+        :param module_id: Module id.
+        :param name: Module name.
+        """
+        self.lists.clear()
+        self.by_id.pop(module_id)
+        self.by_name.pop(name)
+        for key in self.raw.keys():
+            if key[1] == name:
+                self.raw.pop(key)
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "lists": self.lists.get_stats(),
+            "by_id": self.by_id.get_stats(),
+            "by_name": self.by_name.get_stats(),
+            "raw": self.raw.get_stats(),
+            "diffs": self.diffs.get_stats(),
+        }
+
+
+module_cache = ModuleCache()
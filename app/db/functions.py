@@ -1,10 +1,80 @@
+import asyncio
+from datetime import date
+from hashlib import sha256
 from typing import Union
 
-from tortoise.exceptions import DoesNotExist
+from pypika_tortoise import functions as fn
+from pypika_tortoise.terms import Tuple
+from tortoise.exceptions import DoesNotExist, IntegrityError
+from tortoise.expressions import F, Q
+from tortoise.functions import Sum
+from tortoise.transactions import in_transaction
 
 from app.db import models
+from app.db.cache import MISSING, module_cache
+from app.utils.blobs import get_blob_store
+from app.utils.diff import get_diff
+from app.utils.http import compress
+from app.utils.metrics import instrument
+from app.utils.search import search_index
 
+MODULE_FIELDS = ("id", "name", "description", "developer", "hash", "git", "image", "banner", "commands", "revision")
 
+
+@instrument
+class Counter(models.Counter):
+    """
+    Counter model, contains named counters.
+    """
+    @classmethod
+    async def add(cls, name: str, amount: int = 1) -> int:
+        """
+        Increment counter atomically.
+        :param name: Counter name.
+        :param amount: Amount.
+        :return: New value.
+        """
+        async with in_transaction():
+            await cls.bulk_create([cls(name=name, value=0)], ignore_conflicts=True)
+            await cls.filter(name=name).update(value=F("value") + amount)
+            return await cls.filter(name=name).first().values_list("value", flat=True)
+
+    @classmethod
+    async def get_value(cls, name: str) -> int:
+        """
+        Get counter value.
+        :param name: Counter name.
+        :return: Value, 0 if counter does not exist.
+        """
+        value = await cls.filter(name=name).first().values_list("value", flat=True)
+        return value or 0
+
+    @classmethod
+    async def increment(cls, name: str, amount: int = 1):
+        """
+        Increment existing counter without reading it back.
+        :param name: Counter name.
+        :param amount: Amount.
+        """
+        await cls.filter(name=name).update(value=F("value") + amount)
+
+    @classmethod
+    async def set_count(cls, name: str, model):
+        """
+        Set counter to count of rows of model with one statement.
+        :param name: Counter name.
+        :param model: Counted model.
+        """
+        await cls.bulk_create([cls(name=name, value=0)], ignore_conflicts=True)
+        db = cls._choose_db(True)
+        executor = db.executor_class(model=cls, db=db)
+        counter = cls._meta.basetable
+        count = db.query_class.from_(model._meta.basetable).select(fn.Count("*"))
+        query = db.query_class.update(counter).set(counter.value, Tuple(count)).where(counter.name == executor.parameter(0))
+        await db.execute_query(query.get_sql(), [name])
+
+
+@instrument
 class User(models.User):
     """
     User model, contains all methods for working with users.
@@ -22,33 +92,107 @@ class User(models.User):
             return None
 
     @classmethod
-    async def create_user(cls, telegram_id: int) -> dict:
+    async def insert_ignore(cls, telegram_ids: list) -> list:
+        """
+        Insert users skipping existing ones, one statement per chunk.
+        :param telegram_ids: Telegram ids.
+        :return: Rows actually inserted.
+        """
+        db = cls._choose_db(True)
+        executor = db.executor_class(model=cls, db=db)
+        rows = []
+        for start in range(0, len(telegram_ids), 500):
+            chunk = telegram_ids[start:start + 500]
+            query = db.query_class.into(cls._meta.basetable).columns("telegram_id")
+            for i in range(len(chunk)):
+                query = query.insert(executor.parameter(i))
+            query = query.on_conflict().do_nothing()
+            # rowcount isn't reliable on every backend, inserted rows are returned instead
+            rows += await db.execute_query_dict(f"{query.get_sql()} RETURNING id, telegram_id", chunk)
+        return rows
+
+    @classmethod
+    async def create_user(cls, telegram_id: int) -> Union[dict, None]:
         """
-        Create user.
+        Create user with one insert, existing users are skipped by the unique constraint.
         :param telegram_id: Telegram id.
-        :return: User dict.
-        """
-        user = await cls.create(telegram_id=telegram_id)
-        return user
+        :return: User dict or None if user already exists.
+        """
+        async with in_transaction():
+            rows = await cls.insert_ignore([telegram_id])
+            if not rows:
+                return None
+            await Counter.increment("users")
+        return cls._init_from_db(**rows[0])
+
+    @classmethod
+    async def create_users(cls, telegram_ids: list, create: bool = True) -> tuple:
+        """
+        Check many users and create missing ones.
+        :param telegram_ids: Telegram ids.
+        :param create: Create missing users.
+        :return: Created and existing telegram ids.
+        """
+        telegram_ids = list(dict.fromkeys(telegram_ids))
+        if not create:
+            existing = set(await cls.filter(telegram_id__in=telegram_ids).values_list("telegram_id", flat=True))
+            missing = [telegram_id for telegram_id in telegram_ids if telegram_id not in existing]
+            return missing, [telegram_id for telegram_id in telegram_ids if telegram_id in existing]
+
+        async with in_transaction():
+            created = {row["telegram_id"] for row in await cls.insert_ignore(telegram_ids)}
+            if created:
+                await Counter.increment("users", len(created))
+        return (
+            [telegram_id for telegram_id in telegram_ids if telegram_id in created],
+            [telegram_id for telegram_id in telegram_ids if telegram_id not in created],
+        )
 
     @classmethod
     async def get_count(cls) -> int:
         """
-        Get count of users.
+        Get count of users from counter maintained on creation.
         :return: Count of users.
         """
-        return await cls.all().count()
+        return await Counter.get_value("users")
 
     @classmethod
-    async def get_all(cls) -> list:
+    async def sync_count(cls):
+        """
+        Set users counter to real count of users, once on startup.
+        """
+        await Counter.set_count("users", cls)
+
+    @classmethod
+    async def get_page(cls, after: int = None, limit: int = 1000) -> list:
         """
-        Get all users.
-        :return: All users.
+        Get page of users ordered by telegram id.
+        :param after: Return users with telegram id greater than this.
+        :param limit: Page size.
+        :return: Telegram ids.
         """
-        users = await cls.all().values("telegram_id")
-        return [user["telegram_id"] for user in users]
+        query = cls.all() if after is None else cls.filter(telegram_id__gt=after)
+        return await query.order_by("telegram_id").limit(limit).values_list("telegram_id", flat=True)
+
+    @classmethod
+    async def iter_pages(cls, after: int = None, limit: int = 5000):
+        """
+        Iterate over all users page by page.
+        :param after: Start after this telegram id.
+        :param limit: Page size.
+        :return: Async iterator of pages of telegram ids.
+        """
+        while True:
+            page = await cls.get_page(after, limit)
+            if not page:
+                return
+            yield page
+            if len(page) < limit:
+                return
+            after = page[-1]
 
 
+@instrument
 class Developer(models.Developer):
     """
     Developer model, contains all methods for working with developers.
@@ -78,16 +222,18 @@ class Developer(models.Developer):
             return None
         
     @classmethod
-    async def create_developer(cls, telegram_id: int, username: str, git: str) -> dict:
+    async def create_developer(cls, telegram_id: int, username: str, git: str) -> Union[dict, None]:
         """
         Create developer.
         :param telegram_id: Telegram id.
         :param username: Username.
         :param git: Git.
-        :return: Developer dict.
+        :return: Developer dict or None if developer already exists.
         """
-        developer = await cls.create(telegram_id=telegram_id, username=username, git=git, is_verified=False)
-        return developer
+        try:
+            return await cls.create(telegram_id=telegram_id, username=username, git=git, is_verified=False)
+        except IntegrityError:
+            return None
     
     @classmethod
     async def get_all(cls) -> list:
@@ -99,10 +245,39 @@ class Developer(models.Developer):
         return developers
 
 
+@instrument
 class Module(models.Module):
     """
     Module model, contains all methods for working with modules.
     """
+    def get_code(self) -> str:
+        """
+        Get code from row or blob store.
+        :return: Code.
+        """
+        if self.code is not None:
+            return self.code
+        store = get_blob_store()
+        if store is None:
+            return ""
+        return store.get_text(self.hash) or ""
+
+    def get_bodies(self) -> tuple:
+        """
+        Get code and its compressed copies for serving.
+        :return: Code, gzip and brotli bytes, compressed copies may be None.
+        """
+        if self.code is not None:
+            return self.code.encode(), self.code_gzip, self.code_brotli
+        store = get_blob_store()
+        if store is None:
+            return b"", None, None
+        return (
+            store.get(self.hash) or b"",
+            store.get(self.hash, ".gz"),
+            store.get(self.hash, ".br"),
+        )
+
     @classmethod
     async def get_dict(cls, module_id: int) -> Union[dict, None]:
         """
@@ -110,10 +285,15 @@ class Module(models.Module):
         :param module_id: Module id.
         :return: Module dict.
         """
+        module = module_cache.get(module_cache.by_id, module_id)
+        if module is not MISSING:
+            return module
         try:
-            return await cls.get(id=module_id)
+            module = await cls.get(id=module_id)
         except DoesNotExist:
-            return None
+            module = None
+        module_cache.set(module_cache.by_id, module_id, module)
+        return module
 
     @classmethod
     async def get_dict_by_name(cls, module_name: str) -> Union[dict, None]:
@@ -122,10 +302,15 @@ class Module(models.Module):
         :param module_name: Module name.
         :return: Module dict.
         """
+        module = module_cache.get(module_cache.by_name, module_name)
+        if module is not MISSING:
+            return module
         try:
-            return await cls.get(name=module_name)
+            module = await cls.get(name=module_name)
         except DoesNotExist:
-            return None
+            module = None
+        module_cache.set(module_cache.by_name, module_name, module)
+        return module
 
     @classmethod
     async def create_module(cls, name: str, description: str, developer: int, hash: str, git: str, image: str, banner: str, commands: list, code: str) -> dict:
@@ -141,30 +326,232 @@ class Module(models.Module):
         :param code: Code.
         :return: Module dict.
         """
-        if await cls.get_dict_by_name(name) is not None:
-            # update module
-            module = await cls.get_dict_by_name(name)
-            module.description = description
-            module.developer = developer
-            module.hash = hash
-            module.git = git
-            module.image = image
-            module.banner = banner
-            module.commands = commands
-            module.code = code
-            await module.save()
-            return module
-        module = await cls.create(name=name, description=description, developer=developer, hash=hash, git=git, image=image, banner=banner, commands=commands, code=code)
+        code_fields = await asyncio.to_thread(cls.store_code, code, hash)
+        async with in_transaction():
+            revision = await Counter.add("modules")
+            module, _ = await cls.update_or_create(
+                defaults=dict(description=description, developer=developer, git=git, image=image, banner=banner, commands=commands, revision=revision, **code_fields),
+                name=name,
+            )
+        module_cache.invalidate(module.id, name)
+        search_index.add({field: getattr(module, field) for field in MODULE_FIELDS})
         return module
 
+    @staticmethod
+    def store_code(code: str, hash: str) -> dict:
+        """
+        Compress code and put it to blob store when it is enabled.
+        :param code: Code.
+        :param hash: Hash.
+        :return: Row fields for code.
+        """
+        code_gzip, code_brotli = None, None
+        store = get_blob_store()
+        if store is None:
+            code_gzip, code_brotli = compress(code or "")
+        else:
+            hash = store.put((code or "").encode())
+            if not store.exists(hash, ".br"):
+                code_gzip, code_brotli = compress(code or "")
+                store.put(code_gzip, hash, ".gz")
+                store.put(code_brotli, hash, ".br")
+                code_gzip, code_brotli = None, None
+            code = None
+        return {"hash": hash, "code": code, "code_gzip": code_gzip, "code_brotli": code_brotli}
+
+    @classmethod
+    async def create_modules(cls, modules: list) -> list:
+        """
+        Create or update many modules with one upsert.
+        :param modules: List of dicts with create_module params.
+        :return: Created modules without code.
+        """
+        if not modules:
+            return []
+        rows = await cls.build_rows(modules)
+        async with in_transaction():
+            await cls.upsert_rows(rows)
+        return await cls.refresh_rows(rows)
+
+    @classmethod
+    async def build_rows(cls, modules: list) -> list:
+        """
+        Compress code of modules, call it outside of transactions.
+        :param modules: List of dicts with create_module params.
+        :return: Unsaved rows.
+        """
+        def build():
+            rows = []
+            for module in modules:
+                module = dict(module)
+                code = cls.store_code(module.pop("code"), module.pop("hash"))
+                rows.append(cls(**module, **code))
+            return rows
+
+        # compression is cpu bound
+        return await asyncio.to_thread(build)
+
+    @classmethod
+    async def upsert_rows(cls, rows: list):
+        """
+        Give revisions to rows and upsert them by name, call it in a transaction.
+        :param rows: Rows from build_rows.
+        """
+        last = await Counter.add("modules", len(rows))
+        for revision, row in enumerate(rows, last - len(rows) + 1):
+            row.revision = revision
+        await cls.bulk_create(
+            rows,
+            update_fields=["description", "developer", "hash", "git", "image", "banner", "commands", "code", "code_gzip", "code_brotli", "revision"],
+            on_conflict=["name"],
+            batch_size=500,
+        )
+
+    @classmethod
+    async def refresh_rows(cls, rows: list) -> list:
+        """
+        Invalidate cache and search index of upserted rows.
+        :param rows: Upserted rows.
+        :return: Modules without code.
+        """
+        created = await cls.filter(name__in=[row.name for row in rows]).values(*MODULE_FIELDS)
+        for module in created:
+            module_cache.invalidate(module["id"], module["name"])
+            search_index.add(module)
+        return created
+
+    @classmethod
+    async def delete_module(cls, module_id: int) -> bool:
+        """
+        Delete module and leave tombstone for sync clients.
+        :param module_id: Module id.
+        :return: Is deleted.
+        """
+        async with in_transaction():
+            module = await cls.filter(id=module_id).first().values("id", "name")
+            if module is None:
+                return False
+            revision = await Counter.add("modules")
+            await ModuleTombstone.create(module_id=module["id"], name=module["name"], revision=revision)
+            await cls.filter(id=module_id).delete()
+        module_cache.invalidate(module["id"], module["name"])
+        search_index.remove(module["id"])
+        return True
+
+    @classmethod
+    async def get_changes(cls, since: int, limit: int = 1000) -> dict:
+        """
+        Get modules changed and removed after revision.
+        :param since: Revision known by client, 0 for everything.
+        :param limit: Max changes.
+        :return: Changed modules, removed module ids, current revision and cursor for the rest.
+        """
+        revision = await Counter.get_value("modules")
+        modules = await cls.filter(revision__gt=since).order_by("revision").limit(limit).values(*MODULE_FIELDS)
+        removed = await ModuleTombstone.filter(revision__gt=since).order_by("revision").limit(limit).values("module_id", "revision")
+
+        # merge both by revision and cut at limit
+        changes = sorted(
+            [(module["revision"], module) for module in modules]
+            + [(tombstone["revision"], tombstone["module_id"]) for tombstone in removed],
+            key=lambda change: change[0],
+        )
+        more = len(changes) > limit or len(modules) == limit or len(removed) == limit
+        changes = changes[:limit]
+        next_since = changes[-1][0] if more and changes else None
+        return {
+            "revision": revision,
+            "modules": [change for _, change in changes if isinstance(change, dict)],
+            "removed": [change for _, change in changes if not isinstance(change, dict)],
+            "next_since": next_since,
+        }
+
+    @classmethod
+    async def backfill_revisions(cls):
+        """
+        Give revisions to modules created before revisions existed.
+        """
+        ids = await cls.filter(revision=0).order_by("id").values_list("id", flat=True)
+        if not ids:
+            return
+        async with in_transaction():
+            last = await Counter.add("modules", len(ids))
+            for revision, module_id in enumerate(ids, last - len(ids) + 1):
+                await cls.filter(id=module_id).update(revision=revision)
+        module_cache.lists.clear()
+
+    @classmethod
+    async def get_many(cls, ids: list = None, names: list = None) -> list:
+        """
+        Get many modules by ids or names in one query.
+        :param ids: Module ids.
+        :param names: Module names.
+        :return: Modules without code.
+        """
+        if not ids and not names:
+            return []
+        return await cls.filter(Q(id__in=ids or []) | Q(name__in=names or [])).order_by("id").values(*MODULE_FIELDS)
+
     @classmethod
-    async def get_all(cls):
+    async def get_all(cls, cached: bool = True):
         """
         Get all modules.
+        :param cached: Allow cached list, False reads database and refreshes cache.
         :return: All modules.
         """
-        # all modules without code
-        return await cls.all().values("id", "name", "description", "developer", "hash", "git", "image", "banner", "commands")
+        modules = module_cache.get(module_cache.lists, "all") if cached else MISSING
+        if modules is MISSING:
+            # all modules without code
+            modules = await cls.all().values(*MODULE_FIELDS)
+            module_cache.set(module_cache.lists, "all", modules)
+        return modules
+
+    @classmethod
+    async def get_page(cls, after_id: int = 0, limit: int = 100, fields: tuple = MODULE_FIELDS) -> list:
+        """
+        Get page of modules ordered by id.
+        :param after_id: Return modules with id greater than this.
+        :param limit: Page size.
+        :param fields: Fields to return, id is always included.
+        :return: Modules.
+        """
+        if "id" not in fields:
+            fields = ("id", *fields)
+        key = ("page", after_id, limit, fields)
+        modules = module_cache.get(module_cache.lists, key)
+        if modules is MISSING:
+            modules = await cls.filter(id__gt=after_id).order_by("id").limit(limit).values(*fields)
+            module_cache.set(module_cache.lists, key, modules)
+        return modules
+
+    @classmethod
+    async def iter_pages(cls, after_id: int = 0, limit: int = 500, fields: tuple = MODULE_FIELDS):
+        """
+        Iterate over all modules page by page.
+        :param after_id: Start after this id.
+        :param limit: Page size.
+        :param fields: Fields to return, id is always included.
+        :return: Async iterator of pages.
+        """
+        if "id" not in fields:
+            fields = ("id", *fields)
+        while True:
+            # not cached, a full scan would only evict hot pages
+            page = await cls.filter(id__gt=after_id).order_by("id").limit(limit).values(*fields)
+            if not page:
+                return
+            yield page
+            if len(page) < limit:
+                return
+            after_id = page[-1]["id"]
+
+    @classmethod
+    async def get_hashes(cls) -> dict:
+        """
+        Get hashes of all modules.
+        :return: Dict of module name to hash.
+        """
+        return dict(await cls.all().values_list("name", "hash"))
 
     @classmethod
     async def get_modules_by_developer(cls, developer: int):
@@ -176,23 +563,94 @@ class Module(models.Module):
         return await cls.filter(developer=developer)
 
     @classmethod
-    async def get_raw_module(cls, developer: int, module_name: str):
+    async def get_dict_by_developer(cls, developer: str, module_name: str) -> Union[dict, None]:
         """
-        Get raw module.
-        :param developer_id: Developer id.
+        Get module by developer and name.
+        :param developer: Developer username.
         :param module_name: Module name.
-        :return: Raw module.
+        :return: Module dict.
         """
+        key = (developer, module_name)
+        module = module_cache.get(module_cache.raw, key)
+        if module is not MISSING:
+            return module
         try:
-            return (await cls.get(developer=developer, name=module_name)).code
+            module = await cls.get(developer=developer, name=module_name)
         except DoesNotExist:
-            return ""
+            module = None
+        module_cache.set(module_cache.raw, key, module)
+        return module
+
+
+@instrument
+class ModuleTombstone(models.ModuleTombstone):
+    """
+    ModuleTombstone model, contains deleted modules for sync clients.
+    """
 
 
+@instrument
 class Updates(models.Updates):
     """
     Updates model, contains all methods for working with updates.
     """
+    def get_code(self) -> str:
+        """
+        Get new code from row or blob store.
+        :return: New code.
+        """
+        if self.new_code is not None:
+            return self.new_code
+        store = get_blob_store()
+        if store is None or self.hash is None:
+            return ""
+        return store.get_text(self.hash) or ""
+
+    def get_link(self) -> str:
+        """
+        Get link to module file in developer repository.
+        :return: Link.
+        """
+        if self.git.endswith("/"):
+            return self.git + self.name + ".py"
+        return self.git + "/" + self.name + ".py"
+
+    async def get_diff(self) -> str:
+        """
+        Get diff of approved module code and new code, computed once per pair of hashes.
+        :return: Unified diff.
+        """
+        module = await Module.get_dict_by_name(self.name)
+        old_hash = module.hash if module is not None else ""
+        new_code = None
+        new_hash = self.hash
+        if new_hash is None:
+            new_code = self.get_code()
+            new_hash = sha256(new_code.encode()).hexdigest()
+
+        diff = await DiffCache.get_diff(old_hash, new_hash)
+        if diff is None:
+            old_code = module.get_code() if module is not None else ""
+            if new_code is None:
+                new_code = self.get_code()
+            diff = await DiffCache.create_diff(old_code, new_code, old_hash, new_hash)
+        return diff
+
+    @staticmethod
+    def store_code(new_code: str, hash: str = None) -> dict:
+        """
+        Put new code to blob store when it is enabled.
+        :param new_code: New code.
+        :param hash: Sha256 of new code.
+        :return: Row fields for code.
+        """
+        store = get_blob_store()
+        if store is None:
+            if hash is None:
+                hash = sha256(new_code.encode()).hexdigest()
+            return {"new_code": new_code, "hash": hash}
+        return {"new_code": None, "hash": store.put(new_code.encode(), hash)}
+
     @classmethod
     async def get_dict_unapproved(cls) -> Union[dict, None]:
         """
@@ -204,6 +662,14 @@ class Updates(models.Updates):
         except DoesNotExist:
             return None
 
+    @classmethod
+    async def get_unapproved_names(cls) -> set:
+        """
+        Get names of unapproved updates.
+        :return: Set of names.
+        """
+        return set(await cls.filter(approved=False).values_list("name", flat=True))
+
     @classmethod
     async def get_dict_all(cls) -> Union[dict, None]:
         """
@@ -240,25 +706,47 @@ class Updates(models.Updates):
             return None
 
     @classmethod
-    async def create_update(cls, name: str, description: str, developer: str, git: str, image: str, banner: str, commands: list, new_code: str) -> dict:
+    async def create_updates(cls, updates: list, validators: list = None):
+        """
+        Create many updates in one transaction, replacing old updates with same names.
+        :param updates: List of dicts with name, description, developer, git, image, banner,
+            commands, new_code and optional hash.
+        :param validators: FetchCache entries to store in the same transaction.
+        """
+        rows = await cls.build_rows(updates) if updates else []
+        async with in_transaction():
+            if rows:
+                await cls.filter(name__in=[row.name for row in rows]).delete()
+                await cls.bulk_create(rows, batch_size=500)
+            if validators:
+                await FetchCache.store_many(validators)
+
+    @classmethod
+    async def build_rows(cls, updates: list) -> list:
+        """
+        Put code of updates to blob store, call it outside of transactions.
+        :param updates: List of dicts with create_updates params.
+        :return: Unsaved rows.
+        """
+        def build():
+            rows = []
+            for update in updates:
+                update = dict(update)
+                code = cls.store_code(update.pop("new_code"), update.pop("hash", None))
+                rows.append(cls(**update, **code, approved=False))
+            return rows
+
+        # hashing and blob writes are blocking
+        return await asyncio.to_thread(build)
+
+    @classmethod
+    async def precompute_diffs(cls, names: list):
         """
-        Create update.
-        :param name: Name.
-        :param description: Description.
-        :param developer: Developer.
-        :param git: Git.
-        :param image: Image.
-        :param banner: Banner.
-        :param commands: Commands.
-        :param new_code: New code.
-        :return: Update dict.
+        Compute and cache diffs of unapproved updates.
+        :param names: Update names.
         """
-        if await cls.get_dict_by_name(name) is not None:
-            # remove old update
-            update = await cls.get_dict_by_name(name)
-            await update.delete()
-        update = await cls.create(name=name, description=description, developer=developer, git=git, image=image, banner=banner, commands=commands, new_code=new_code, approved=False)
-        return update    
+        for update in await cls.filter(name__in=names, approved=False):
+            await update.get_diff()
 
     @classmethod
     async def approve_update(cls, update_id: int):
@@ -273,3 +761,219 @@ class Updates(models.Updates):
 
         update.approved = True
         await update.save()
+
+    @classmethod
+    async def approve_updates(cls, update_ids: list) -> list:
+        """
+        Approve many updates in one transaction.
+        :param update_ids: Update ids.
+        :return: Approved update ids.
+        """
+        updates = await cls.filter(id__in=update_ids).order_by("id")
+        # the latest update wins when several have the same name
+        latest = {update.name: update for update in updates}
+        modules = []
+        for update in latest.values():
+            new_code = update.get_code()
+            modules.append(dict(
+                name=update.name,
+                description=update.description,
+                developer=update.developer,
+                hash=sha256(new_code.encode()).hexdigest(),
+                git=update.get_link(),
+                image=update.image,
+                banner=update.banner,
+                commands=update.commands,
+                code=new_code,
+            ))
+        if not modules:
+            return []
+        # compress before the transaction, sqlite holds its lock for the whole transaction
+        rows = await Module.build_rows(modules)
+        async with in_transaction():
+            await Module.upsert_rows(rows)
+            await cls.filter(id__in=[update.id for update in updates]).update(approved=True)
+        await Module.refresh_rows(rows)
+        return [update.id for update in updates]
+
+
+@instrument
+class FetchCache(models.FetchCache):
+    """
+    FetchCache model, contains HTTP validators of fetched repository files.
+    """
+    @classmethod
+    async def get_all_dict(cls) -> dict:
+        """
+        Get all cached validators.
+        :return: Dict of url to entry.
+        """
+        return {entry.url: entry for entry in await cls.all()}
+
+    @classmethod
+    async def store_many(cls, entries: list):
+        """
+        Insert or update validators.
+        :param entries: FetchCache entries.
+        """
+        if not entries:
+            return
+        await cls.bulk_create(
+            entries,
+            update_fields=["etag", "last_modified", "hash", "body"],
+            on_conflict=["url"],
+        )
+
+
+@instrument
+class DiffCache(models.DiffCache):
+    """
+    DiffCache model, contains diffs of module code keyed by old and new code hashes.
+    """
+    @staticmethod
+    def get_key(old_hash: str, new_hash: str) -> str:
+        return f"{old_hash or ''}:{new_hash}"
+
+    @classmethod
+    async def get_diff(cls, old_hash: str, new_hash: str) -> Union[str, None]:
+        """
+        Get cached diff.
+        :param old_hash: Old code hash, empty for new modules.
+        :param new_hash: New code hash.
+        :return: Diff or None if it's not computed yet.
+        """
+        key = cls.get_key(old_hash, new_hash)
+        diff = module_cache.get(module_cache.diffs, key)
+        if diff is not MISSING:
+            return diff
+
+        entry = await cls.get_or_none(key=key)
+        if entry is None:
+            return None
+        module_cache.set(module_cache.diffs, key, entry.diff)
+        return entry.diff
+
+    @classmethod
+    async def create_diff(cls, old_code: str, new_code: str, old_hash: str, new_hash: str) -> str:
+        """
+        Compute diff in thread and cache it.
+        :param old_code: Old code.
+        :param new_code: New code.
+        :param old_hash: Old code hash, empty for new modules.
+        :param new_hash: New code hash.
+        :return: Diff.
+        """
+        key = cls.get_key(old_hash, new_hash)
+        diff = await asyncio.to_thread(get_diff, old_code, new_code)
+        await cls.bulk_create([cls(key=key, diff=diff)], ignore_conflicts=True)
+        module_cache.set(module_cache.diffs, key, diff)
+        return diff
+
+
+@instrument
+class Downloads(models.Downloads):
+    """
+    Downloads model, contains download counts of modules per day.
+    """
+    @classmethod
+    async def add_counts(cls, counts: dict, day: date):
+        """
+        Add download counts in one transaction, increments are atomic so workers can flush concurrently.
+        :param counts: Dict of module id to downloads.
+        :param day: Day.
+        """
+        if not counts:
+            return
+        keys = {module_id: f"{module_id}:{day.isoformat()}" for module_id in counts}
+        async with in_transaction():
+            await cls.bulk_create(
+                [cls(key=key, module_id=module_id, day=day, count=0) for module_id, key in keys.items()],
+                ignore_conflicts=True,
+            )
+            for module_id, count in counts.items():
+                await cls.filter(key=keys[module_id]).update(count=F("count") + count)
+
+    @classmethod
+    async def get_ranking(cls, since: date = None, limit: int = 100) -> list:
+        """
+        Get most downloaded modules.
+        :param since: First day, None for all time.
+        :param limit: Limit.
+        :return: List of (module id, downloads).
+        """
+        query = cls.all() if since is None else cls.filter(day__gte=since)
+        rows = await (
+            query.annotate(downloads=Sum("count"))
+            .group_by("module_id")
+            .order_by("-downloads", "module_id")
+            .limit(limit)
+            .values("module_id", "downloads")
+        )
+        return [(row["module_id"], row["downloads"]) for row in rows]
+
+
+JOB_FIELDS = ("status", "started_at", "finished_at", "developers_total", "developers_done",
+              "modules_fetched", "updates_created", "errors")
+
+
+@instrument
+class CrawlJobState(models.CrawlJobState):
+    """
+    CrawlJobState model, shares crawl jobs between worker processes.
+    """
+    @classmethod
+    async def save_job(cls, job: dict) -> bool:
+        """
+        Create or update job.
+        :param job: Job dict.
+        :return: Is cancel requested by another worker.
+        """
+        await cls.update_or_create(defaults={field: job[field] for field in JOB_FIELDS}, job_id=job["id"])
+        return bool(await cls.filter(job_id=job["id"]).first().values_list("cancel_requested", flat=True))
+
+    @classmethod
+    async def get_job(cls, job_id: str) -> Union[dict, None]:
+        """
+        Get job.
+        :param job_id: Job id.
+        :return: Job dict or None.
+        """
+        job = await cls.filter(job_id=job_id).first().values("job_id", *JOB_FIELDS)
+        if job is None:
+            return None
+        job["id"] = job.pop("job_id")
+        return job
+
+    @classmethod
+    async def get_running_id(cls) -> Union[str, None]:
+        """
+        Get id of running job.
+        :return: Job id or None.
+        """
+        return await cls.filter(status="running").order_by("-id").first().values_list("job_id", flat=True)
+
+    @classmethod
+    async def request_cancel(cls, job_id: str) -> bool:
+        """
+        Ask worker running job to cancel it.
+        :param job_id: Job id.
+        :return: Is job running.
+        """
+        return await cls.filter(job_id=job_id, status="running").update(cancel_requested=True) > 0
+
+    @classmethod
+    async def interrupt_running(cls):
+        """
+        Mark jobs left running by a dead worker, call it holding the crawl lock.
+        """
+        await cls.filter(status="running").update(status="interrupted")
+
+    @classmethod
+    async def prune(cls, keep: int):
+        """
+        Delete all but last jobs.
+        :param keep: Jobs to keep.
+        """
+        ids = await cls.all().order_by("-id").offset(keep).values_list("id", flat=True)
+        if ids:
+            await cls.filter(id__in=ids).delete()
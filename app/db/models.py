@@ -4,21 +4,21 @@ from tortoise.models import Model
 
 class User(Model):
     id = fields.BigIntField(pk=True, unique=True)
-    telegram_id = fields.BigIntField()
+    telegram_id = fields.BigIntField(unique=True)
 
 class Developer(Model):
     id = fields.BigIntField(pk=True, unique=True)
-    telegram_id = fields.BigIntField()
-    username = fields.CharField(max_length=255)
+    telegram_id = fields.BigIntField(unique=True)
+    username = fields.CharField(max_length=255, unique=True)
 
     git = fields.CharField(max_length=255)
     is_verified = fields.BooleanField()
 
 class Module(Model):
     id = fields.BigIntField(pk=True, unique=True)
-    name = fields.CharField(max_length=255)
+    name = fields.CharField(max_length=255, unique=True)
     description = fields.TextField(null=True)
-    developer = fields.CharField(max_length=255)
+    developer = fields.CharField(max_length=255, index=True)
     hash = fields.CharField(max_length=255)
     git = fields.CharField(max_length=255)
     image = fields.CharField(max_length=255, null=True)
@@ -26,15 +26,76 @@ class Module(Model):
     commands = fields.JSONField(null=True)
     # [ { "command": "description" } ]
     code = fields.TextField(null=True)
+    # precompressed code for downloads
+    code_gzip = fields.BinaryField(null=True)
+    code_brotli = fields.BinaryField(null=True)
+    # catalog revision of last change
+    revision = fields.BigIntField(default=0, index=True)
 
-class Updates(Model):
+
+class ModuleTombstone(Model):
     id = fields.BigIntField(pk=True, unique=True)
+    module_id = fields.BigIntField()
     name = fields.CharField(max_length=255)
+    revision = fields.BigIntField(index=True)
+
+class Updates(Model):
+    id = fields.BigIntField(pk=True, unique=True)
+    name = fields.CharField(max_length=255, index=True)
     description = fields.TextField(null=True)
     developer = fields.CharField(max_length=255)
     git = fields.CharField(max_length=255)
     image = fields.CharField(max_length=255, null=True)
     banner = fields.CharField(max_length=525, null=True)
     commands = fields.JSONField(null=True)
-    new_code = fields.TextField()
-    approved = fields.BooleanField()
+    # null when code is kept in blob store
+    new_code = fields.TextField(null=True)
+    hash = fields.CharField(max_length=255, null=True)
+    approved = fields.BooleanField(index=True)
+
+
+class FetchCache(Model):
+    id = fields.BigIntField(pk=True, unique=True)
+    url = fields.CharField(max_length=512, unique=True)
+    etag = fields.CharField(max_length=255, null=True)
+    last_modified = fields.CharField(max_length=255, null=True)
+    hash = fields.CharField(max_length=255)
+    # kept only for small index files like full.txt
+    body = fields.TextField(null=True)
+
+
+class DiffCache(Model):
+    id = fields.BigIntField(pk=True, unique=True)
+    # "old_hash:new_hash", old hash is empty for new modules
+    key = fields.CharField(max_length=160, unique=True)
+    diff = fields.TextField()
+
+
+class Counter(Model):
+    id = fields.BigIntField(pk=True, unique=True)
+    name = fields.CharField(max_length=64, unique=True)
+    value = fields.BigIntField(default=0)
+
+
+class Downloads(Model):
+    id = fields.BigIntField(pk=True, unique=True)
+    # "module_id:YYYY-MM-DD"
+    key = fields.CharField(max_length=64, unique=True)
+    module_id = fields.BigIntField(index=True)
+    day = fields.DateField(index=True)
+    count = fields.BigIntField(default=0)
+
+
+class CrawlJobState(Model):
+    id = fields.BigIntField(pk=True, unique=True)
+    job_id = fields.CharField(max_length=32, unique=True)
+    status = fields.CharField(max_length=16, index=True)
+    started_at = fields.DatetimeField()
+    finished_at = fields.DatetimeField(null=True)
+    developers_total = fields.IntField(default=0)
+    developers_done = fields.IntField(default=0)
+    modules_fetched = fields.IntField(default=0)
+    updates_created = fields.IntField(default=0)
+    errors = fields.JSONField(default=list)
+    # set by any worker, the crawling worker polls it
+    cancel_requested = fields.BooleanField(default=False)
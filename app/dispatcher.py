@@ -1,15 +1,85 @@
-from fastapi import FastAPI
-from app.version import branch, get_info
+import asyncio
+import logging
+import os
+import signal
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import coloredlogs
+from fastapi import FastAPI, Response
+from app.config import config_watcher, load_config
+from app.db import close_orm, init_orm
+from app.version import build_info
 from app.handlers import router as handlers_router
+from app.db.cache import module_cache
+from app.db.functions import Module, User
+from app.utils.blobs import init_blob_store
+from app.utils.catalog import catalog
+from app.utils.coalesce import coalescer
+from app.utils.crawler import close_crawler, init_crawler
+from app.utils.downloads import downloads
+from app.utils import metrics
+from app.utils.jobs import jobs
+from app.utils.parser import close_parser, init_parser
 
 
 def dispatcher(context):
-    app = FastAPI()
+    config = context["config"]
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await init_orm(config.database.get_tortoise_config())
+        module_cache.configure(**config.cache.get_config())
+        if config.storage.blobs:
+            init_blob_store(config.storage.path)
+        if hasattr(signal, "SIGHUP"):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, config_watcher.reload)
+        await init_crawler(config.crawler.get_config())
+        init_parser(config.parser.get_config())
+        jobs.set_lock(config.crawler.lock_file)
+        jobs.start_scheduler(config.crawler.interval)
+        await build_info.start(config.web.info_interval)
+        await Module.backfill_revisions()
+        await User.sync_count()
+        await downloads.start(**config.downloads.get_config())
+        await catalog.start(**config.catalog.get_config())
+        yield
+        await catalog.stop()
+        await downloads.stop()
+        await build_info.stop()
+        await jobs.stop()
+        close_parser()
+        await close_crawler()
+        await close_orm()
+
+    metrics.configure(**config.metrics.get_config())
+    coalescer.configure(**config.coalesce.get_config())
+
+    app = FastAPI(lifespan=lifespan)
     app.include_router(router=handlers_router, prefix="/api")
+    if config.metrics.enabled:
+        app.add_middleware(metrics.MetricsMiddleware)
+
+        @app.get("/metrics", include_in_schema=False)
+        async def get_metrics():
+            return Response(
+                content=metrics.registry.render(), media_type="text/plain; version=0.0.4"
+            )
 
     @app.get("/")
     async def root():
-        git_info = get_info(branch)
-        return {"name": "limoka", "start_time": context["start_time"], **git_info}
+        return {"name": "limoka", "start_time": context["start_time"], **build_info.info}
 
     return app
+
+
+def create_app() -> FastAPI:
+    """
+    ASGI app factory, called by uvicorn in every worker process.
+    Config file and start time are passed by the parent process in environment.
+    """
+    coloredlogs.install(level=logging.INFO)
+    config = load_config(os.environ.get("LIMOKA_CONFIG", "config.toml"))
+    start_time = os.environ.get("LIMOKA_START_TIME")
+    start_time = datetime.fromisoformat(start_time) if start_time else datetime.now()
+    return dispatcher({"start_time": start_time, "config": config})
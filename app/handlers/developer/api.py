@@ -39,6 +39,8 @@ async def create_developer(developer_telegram_id: int, username: str, git: str):
     :return: Developer dict.
     """
     developer = await Developer.create_developer(developer_telegram_id, username, git)
+    if developer is None:
+        return {"error": "Developer already exists."}
     # modules = get_git_modules(git)
 
     # for module in modules:
@@ -1,21 +1,192 @@
-from fastapi import APIRouter, Depends, Response
+from fastapi import APIRouter, Body, Depends, Request, Response
+from fastapi.responses import StreamingResponse
+from app.config import get_config
 from app.protect import verify_token_main
-from app.utils.parser import get_git_modules, get_module, get_module_info
+from app.utils.catalog import FORMATS, catalog
+from app.utils.coalesce import coalescer
+from app.utils.downloads import downloads
+from app.utils.jobs import jobs
+from app.utils.search import search_index
 
-from app.db.functions import Module, Developer, Updates
-from app.utils.diff import get_diff, get_html_diff
+from app.db.cache import module_cache
+from app.db.functions import MODULE_FIELDS, Module, Developer, Updates
+from app.utils.diff import get_html_diff, paginate_diff
+from app.utils.http import code_response
 
 from hashlib import sha256
+from typing import List, Optional
+import json
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
 
 @router.get("/all")
-async def get_modules():
-    modules = await Module.get_all()
-    return modules
+async def get_modules(
+    request: Request,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    stream: Optional[str] = None,
+):
+    """
+    Get modules. Without parameters returns the whole catalog as one list.
+    :param after_id: Return modules with id greater than this.
+    :param limit: Page size.
+    :param fields: Comma separated fields to return.
+    :param stream: "ndjson" or "json" to stream the whole catalog.
+    :return: Modules page and next cursor.
+    """
+    if after_id is None and limit is None and fields is None and stream is None:
+        response = catalog_response(request, "json")
+        if response is not None:
+            return response
+        modules = await coalescer.do("all", None, Module.get_all)
+        return modules
+
+    selected = MODULE_FIELDS
+    if fields:
+        selected = tuple(field.strip() for field in fields.split(",") if field.strip())
+        unknown = [field for field in selected if field not in MODULE_FIELDS]
+        if unknown:
+            return {"error": f"Unknown fields: {', '.join(unknown)}."}
+
+    if stream is not None:
+        if stream not in ("ndjson", "json"):
+            return {"error": "Unknown stream format."}
+        return StreamingResponse(
+            stream_modules(after_id or 0, selected, stream),
+            media_type="application/x-ndjson" if stream == "ndjson" else "application/json",
+        )
+
+    limit = min(max(limit or PAGE_LIMIT, 1), MAX_PAGE_LIMIT)
+    modules = await Module.get_page(after_id or 0, limit, selected)
+    return {
+        "modules": modules,
+        "next_after_id": modules[-1]["id"] if len(modules) == limit else None,
+    }
+
+
+def catalog_response(request: Request, format: str) -> Optional[Response]:
+    snapshot = catalog.get(format)
+    if snapshot is None:
+        return None
+    version, body, gzip, brotli = snapshot
+    return code_response(request, body, f"{version}.{format}", gzip, brotli, media_type=FORMATS[format])
+
+
+@router.get("/catalog")
+async def get_catalog(request: Request, format: str = "json"):
+    """
+    Get whole catalog as prebuilt snapshot, ETag is the snapshot version.
+    :param format: "json" or "msgpack".
+    :return: Modules without code.
+    """
+    if format not in FORMATS:
+        return {"error": "Unknown format."}
+    response = catalog_response(request, format)
+    if response is None:
+        return {"error": "Catalog is not built yet."}
+    return response
+
+
+async def stream_modules(after_id: int, fields: tuple, stream: str):
+    first = True
+    if stream == "json":
+        yield "["
+    async for page in Module.iter_pages(after_id, fields=fields):
+        if stream == "ndjson":
+            yield "".join(json.dumps(module, ensure_ascii=False) + "\n" for module in page)
+            continue
+        chunk = ",".join(json.dumps(module, ensure_ascii=False) for module in page)
+        yield chunk if first else "," + chunk
+        first = False
+    if stream == "json":
+        yield "]"
+
+
+@router.get("/search")
+async def search_modules(q: str, offset: int = 0, limit: int = PAGE_LIMIT):
+    """
+    Search modules by name, description, developer and commands.
+    :param q: Query.
+    :param offset: Offset.
+    :param limit: Page size.
+    :return: Total count and modules ordered by relevance.
+    """
+    total, modules = search_index.search(q, max(offset, 0), min(max(limit, 0), MAX_PAGE_LIMIT))
+    return {"total": total, "modules": modules}
+
+
+@router.post("/batch")
+async def get_modules_batch(ids: List[int] = Body(default=[]), names: List[str] = Body(default=[])):
+    """
+    Get many modules by ids or names in one request.
+    :param ids: Module ids.
+    :param names: Module names.
+    :return: Found modules and requested ids and names which were not found.
+    """
+    if len(ids) + len(names) > MAX_PAGE_LIMIT:
+        return {"error": f"Too many modules, max {MAX_PAGE_LIMIT}."}
+    modules = await Module.get_many(ids, names)
+    found_ids = {module["id"] for module in modules}
+    found_names = {module["name"] for module in modules}
+    return {
+        "modules": [
+            {field: module[field] for field in MODULE_FIELDS if field != "git"}
+            for module in modules
+        ],
+        "not_found": {
+            "ids": [module_id for module_id in ids if module_id not in found_ids],
+            "names": [name for name in names if name not in found_names],
+        },
+    }
+
+
+@router.post("/approve_updates", dependencies=[Depends(verify_token_main)])
+async def approve_updates(ids: List[int] = Body(embed=True)):
+    approved = await Updates.approve_updates(ids)
+    catalog.invalidate()
+    return {
+        "status": "ok",
+        "approved": approved,
+        "not_found": [update_id for update_id in ids if update_id not in approved],
+    }
+
+
+@router.get("/popular")
+async def get_popular_modules(window: int = 7, offset: int = 0, limit: int = 20):
+    """
+    Get most downloaded modules, ranking is rebuilt periodically.
+    :param window: Window in days, 0 is all time.
+    :param offset: Offset.
+    :param limit: Page size.
+    :return: Modules with downloads.
+    """
+    modules = downloads.get_popular(window, max(offset, 0), min(max(limit, 0), MAX_PAGE_LIMIT))
+    if modules is None:
+        return {"error": f"Unknown window, available: {downloads.windows}."}
+    return {"window": window, "modules": modules}
+
+
+@router.get("/changes")
+async def get_changes(since: int = 0, limit: int = MAX_PAGE_LIMIT):
+    """
+    Get modules added, changed or removed after revision.
+    :param since: Last revision seen by client, 0 for everything.
+    :param limit: Max changes, next_since is set when there are more.
+    :return: Current revision, changed modules and removed module ids.
+    """
+    return await Module.get_changes(max(since, 0), min(max(limit, 1), MAX_PAGE_LIMIT))
+
+
+@router.get("/cache_stats", dependencies=[Depends(verify_token_main)])
+async def get_cache_stats():
+    return module_cache.get_stats()
 
 
 @router.get("/{module_id}")
@@ -33,83 +204,84 @@ async def get_module_dict(module_id: int):
     }
 
 
-@router.get("/{developer_username}/{module_name}.py")
-async def get_raw_module_by_full_link(developer_username: str, module_name: str):
+@router.delete("/{module_id}", dependencies=[Depends(verify_token_main)])
+async def delete_module(module_id: int):
+    if not await Module.delete_module(module_id):
+        return {"error": "Module not found."}
+    catalog.invalidate()
+    return {"status": "ok"}
+
+
+def get_module_bodies(module) -> Optional[tuple]:
+    if module is None:
+        return None
+    return (module.id, module.hash, *module.get_bodies())
+
+
+def raw_module_response(request: Request, bodies: tuple) -> Response:
+    module_id, hash, body, code_gzip, code_brotli = bodies
+    response = code_response(request, body, hash, code_gzip, code_brotli)
+    if response.status_code == 200:
+        downloads.hit(module_id)
+    return response
+
+
+async def get_module_by_id(module_id: int) -> Optional[tuple]:
+    return get_module_bodies(await Module.get_dict(module_id=module_id))
+
+
+async def get_module_by_link(developer_username: str, module_name: str) -> tuple:
+    """
+    :return: Whether developer exists and module bodies.
+    """
     developer = await Developer.get_dict_by_username(developer_username)
     if developer is None:
+        return False, None
+    return True, get_module_bodies(await Module.get_dict_by_developer(developer_username, module_name))
+
+
+@router.get("/{developer_username}/{module_name}.py")
+async def get_raw_module_by_full_link(request: Request, developer_username: str, module_name: str):
+    found, bodies = await coalescer.do(
+        "download", (developer_username, module_name),
+        lambda: get_module_by_link(developer_username, module_name),
+    )
+    if not found:
         return {"error": "Developer not found."}
-    module = await Module.get_raw_module(developer_username, module_name)
-    return Response(content=module, media_type="text/plain")
+    if bodies is None:
+        return Response(content="", media_type="text/plain")
+    return raw_module_response(request, bodies)
 
 
 @router.get("/download/{module_id}")
-async def get_raw_module(module_id: int):
-    module = await Module.get_dict(module_id=module_id)
-    if module is None:
+async def get_raw_module(request: Request, module_id: int):
+    bodies = await coalescer.do(
+        "download", module_id,
+        lambda: get_module_by_id(module_id),
+    )
+    if bodies is None:
         return {"error": "Module not found."}
-    module = module.code
-    return Response(content=module, media_type="text/plain")
+    return raw_module_response(request, bodies)
 
 
 @router.get("/check_updates/", dependencies=[Depends(verify_token_main)])
 async def check_updates():
-    all_developers = await Developer.all()
-    modules_in_db = [module.name for module in await Module.all()]
+    job_id, started = await jobs.start()
+    return {"status": "started" if started else "running", "job_id": job_id}
 
-    for developer in all_developers:
-        unapproved_updates = [update.name for update in await Updates.get_dict_unapproved()]
-        modules_in_git = get_git_modules(developer.git)
 
-        if not hasattr(modules_in_git, "__iter__"):
-            continue
+@router.get("/check_updates/{job_id}", dependencies=[Depends(verify_token_main)])
+async def get_check_updates_job(job_id: str):
+    job = await jobs.get(job_id)
+    if job is None:
+        return {"error": "Job not found."}
+    return job
 
-        for module in modules_in_git:
-            if module == "":
-                continue
-            try:
-                code = get_module(module, developer.git)
-                info = get_module_info(code)
-            except Exception as e:
-                logger.error(f"Error while getting module info: {e}")
-                continue
-
-            if not info:
-                continue
-
-            if module in modules_in_db:
-                module_db = await Module.get_dict_by_name(module)
-                code = get_module(module, developer.git)
-                if sha256(code.encode()).hexdigest() != module_db.hash:
-                    logger.info(f"Update for {module} found.")
-                    await Updates.create_update(
-                        name=module,
-                        description=info["description"],
-                        developer=developer.username,
-                        git=developer.git,
-                        image=info["meta"]["pic"],
-                        banner=info["meta"]["banner"],
-                        commands=info["commands"],
-                        new_code=code,
-                    )
-                else:
-                    logger.info(f"No updates for {module}.")
-            else:
-                if module not in unapproved_updates:
-                    logger.info(f"New module {module} found.")
-                else:
-                    logger.info(f"New module {module} found, but it's already in unapproved updates.")
-
-                await Updates.create_update(
-                    name=module,
-                    description=info["description"],
-                    developer=developer.username,
-                    git=developer.git,
-                    image=info["meta"]["pic"],
-                    banner=info["meta"]["banner"],
-                    commands=info["commands"],
-                    new_code=code,
-                )
 
+@router.get("/check_updates/{job_id}/cancel", dependencies=[Depends(verify_token_main)])
+async def cancel_check_updates_job(job_id: str):
+    if not await jobs.cancel(job_id):
+        return {"error": "Job not found."}
     return {"status": "ok"}
 
 
@@ -119,46 +291,52 @@ async def approve_update(update_id: int):
     if update is None:
         return {"error": "Update not found."}
     await Updates.approve_update(update_id)
-    link = ""
-    if update.git.endswith("/"):
-        link = update.git + update.name + ".py"
-    else:
-        link = update.git + "/" + update.name + ".py"
+    new_code = update.get_code()
     await Module.create_module(
         update.name,
         update.description,
         update.developer,
-        sha256(update.new_code.encode()).hexdigest(),
-        link,
+        sha256(new_code.encode()).hexdigest(),
+        update.get_link(),
         update.image,
         update.banner,
         update.commands,
-        update.new_code
+        new_code
     )
+    catalog.invalidate()
     return {"status": "ok"}
 
 
 @router.get("/get_unapproved_updates/", dependencies=[Depends(verify_token_main)])
 async def get_unapproved_updates():
     updates = await Updates.get_dict_unapproved()
+    for update in updates:
+        update.new_code = update.get_code()
     return updates
 
 
 @router.get("/get_diff/{update_id}/{type}")
-async def get_diff_update(update_id: int, type: str):
-    update = await Updates.get_dict(update_id)
-    if update is None:
+async def get_diff_update(update_id: int, type: str, page: int = 1):
+    rendered = await coalescer.do(
+        "get_diff", (update_id, type == "html", page),
+        lambda: render_diff(update_id, type == "html", page),
+    )
+    if rendered is None:
         return {"error": "Update not found."}
 
-    module = await Module.get_dict_by_name(update.name)
-    code = ""
-    if module is not None:
-        code = module.code
-
-    if type == "html":
-        return Response(
-            content=get_html_diff(code, update.new_code), media_type="text/html"
-        )
+    content, pages = rendered
+    headers = {"X-Diff-Page": str(page), "X-Diff-Pages": str(pages)}
     return Response(
-        content=get_diff(code, update.new_code), media_type="text/plain"
+        content=content, media_type="text/html" if type == "html" else "text/plain", headers=headers
+    )
+
+
+async def render_diff(update_id: int, html: bool, page: int) -> Optional[tuple]:
+    update = await Updates.get_dict(update_id)
+    if update is None:
+        return None
+
+    diff, pages = paginate_diff(
+        await update.get_diff(), page, get_config().diff.page_lines
     )
+    return get_html_diff(diff) if html else diff, pages
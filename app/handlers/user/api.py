@@ -1,15 +1,42 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from app.protect import verify_token_main
 
 from app.db.functions import User
 
 router = APIRouter()
 
+MAX_PAGE_LIMIT = 10000
+
 
 @router.get("/all", dependencies=[Depends(verify_token_main)])
-async def get_all_users():
-    users = await User.get_all()
-    return users
+async def get_all_users(after: Optional[int] = None, limit: Optional[int] = None):
+    """
+    Get telegram ids of users. Without limit streams all of them as one list.
+    :param after: Return users with telegram id greater than this.
+    :param limit: Page size.
+    :return: Users page and next cursor.
+    """
+    if limit is None:
+        return StreamingResponse(stream_users(after), media_type="application/json")
+
+    limit = min(max(limit, 1), MAX_PAGE_LIMIT)
+    users = await User.get_page(after, limit)
+    return {
+        "users": users,
+        "next_after": users[-1] if len(users) == limit else None,
+    }
+
+
+async def stream_users(after: Optional[int]):
+    first = True
+    yield "["
+    async for page in User.iter_pages(after):
+        chunk = ",".join(map(str, page))
+        yield chunk if first else "," + chunk
+        first = False
+    yield "]"
 
 
 @router.get("/count")
@@ -18,6 +45,15 @@ async def get_count():
     return {"count": count}
 
 
+@router.post("/batch", dependencies=[Depends(verify_token_main)])
+async def create_users(telegram_ids: List[int] = Body(embed=True), create: bool = True):
+    if len(telegram_ids) > MAX_PAGE_LIMIT:
+        return {"error": f"Too many users, max {MAX_PAGE_LIMIT}."}
+    created, existing = await User.create_users(telegram_ids, create)
+    key = "created" if create else "missing"
+    return {key: created, "existing": existing}
+
+
 @router.get("/{user_id}")
 async def get_user(tg_id: int):
     user = await User.get_dict(tg_id=tg_id)
@@ -26,8 +62,5 @@ async def get_user(tg_id: int):
 
 @router.post("/", dependencies=[Depends(verify_token_main)])
 async def create_user(telegram_id: int):
-    if await User.get_dict(tg_id=telegram_id):
-        return {"error": "User already exists."}
-
     user = await User.create_user(telegram_id=telegram_id)
-    return user
+    return user or {"error": "User already exists."}
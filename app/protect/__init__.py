@@ -1,9 +1,11 @@
+import hmac
+
 from fastapi import HTTPException, Header
 
-from app.config import parse_config
+from app.config import get_config
 
 
 async def verify_token_main(token: str = Header("token")):
-    config = parse_config()
-    if not token == config.token.get_config()["main"]:
+    config = get_config()
+    if not hmac.compare_digest(token.encode(), config.token.main.encode()):
         raise HTTPException(status_code=403, detail="Unauthorized token.")
@@ -0,0 +1,91 @@
+import logging
+import mmap
+import os
+import tempfile
+from hashlib import sha256
+from typing import Optional
+
+from cachetools import LRUCache
+
+
+class BlobStore:
+    """
+    Content-addressed on-disk store, blobs are keyed by sha256 of their content.
+    """
+    def __init__(self, path: str, open_maps: int = 256):
+        self.path = os.path.abspath(path)
+        # mappings stay valid while memoryviews of them are alive
+        self.maps = LRUCache(maxsize=open_maps)
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_path(self, hash: str, suffix: str = "") -> str:
+        return os.path.join(self.path, hash[:2], hash + suffix)
+
+    def exists(self, hash: str, suffix: str = "") -> bool:
+        return os.path.isfile(self.get_path(hash, suffix))
+
+    def put(self, data: bytes, hash: str = None, suffix: str = "") -> str:
+        """
+        Store blob unless it is already stored.
+        :param data: Content.
+        :param hash: Sha256 of content, computed if not given.
+        :param suffix: Suffix for derived blobs, e.g. compressed copies.
+        :return: Hash.
+        """
+        if hash is None:
+            hash = sha256(data).hexdigest()
+        path = self.get_path(hash, suffix)
+        if os.path.isfile(path):
+            return hash
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return hash
+
+    def get(self, hash: str, suffix: str = "") -> Optional[memoryview]:
+        """
+        Get read-only view of blob, backed by mmap.
+        :param hash: Hash.
+        :param suffix: Suffix.
+        :return: Memoryview or None.
+        """
+        key = hash + suffix
+        mapped = self.maps.get(key)
+        if mapped is not None:
+            return memoryview(mapped)
+
+        try:
+            with open(self.get_path(hash, suffix), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return memoryview(b"")
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+        self.maps[key] = mapped
+        return memoryview(mapped)
+
+    def get_text(self, hash: str) -> Optional[str]:
+        view = self.get(hash)
+        if view is None:
+            return None
+        return str(view, "utf-8")
+
+
+blob_store: Optional[BlobStore] = None
+
+
+def init_blob_store(path: str) -> None:
+    global blob_store
+    blob_store = BlobStore(path)
+    logging.info(f"Blob store at {blob_store.path}")
+
+
+def get_blob_store() -> Optional[BlobStore]:
+    return blob_store
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from hashlib import sha256
+from typing import Optional
+
+import msgpack
+
+from app.db.cache import module_cache
+from app.db.functions import Counter, Module
+from app.utils.http import compress
+from app.utils.search import search_index
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: str
+    count: int
+    # format -> (body, gzip, brotli)
+    bodies: dict
+
+
+def build_snapshot(modules: list) -> Snapshot:
+    """
+    Serialize and compress catalog.
+    :param modules: Module dicts without code.
+    :return: Snapshot.
+    """
+    body = json.dumps(modules, ensure_ascii=False, separators=(",", ":")).encode()
+    packed = msgpack.packb(modules)
+    # lower brotli quality, the catalog is much larger than a module
+    bodies = {
+        "json": (body, *compress(body, quality=9)),
+        "msgpack": (packed, *compress(packed, quality=9)),
+    }
+    return Snapshot(version=sha256(body).hexdigest()[:32], count=len(modules), bodies=bodies)
+
+
+class Catalog:
+    """
+    Whole catalog prebuilt as immutable bytes, rebuilt in background when modules change.
+    Search index and module cache of the worker are updated with it.
+    """
+    def __init__(self):
+        self.snapshot: Optional[Snapshot] = None
+        # modules revision the snapshot was built at
+        self.revision: Optional[int] = None
+        self.dirty = False
+        self.task: Optional[asyncio.Task] = None
+        self.refresher: Optional[asyncio.Task] = None
+
+    async def build(self) -> bool:
+        """
+        Build snapshot from database unless modules revision is unchanged.
+        :return: Is rebuilt.
+        """
+        revision = await Counter.get_value("modules")
+        if self.snapshot is not None and revision == self.revision:
+            return False
+        # not from module cache, it may hold changes of other workers back
+        modules = await Module.get_all(cached=False)
+        self.snapshot = await asyncio.to_thread(build_snapshot, list(modules))
+        self.apply_changes(modules, self.revision)
+        self.revision = revision
+        logger.info(f"Catalog snapshot {self.snapshot.version} built at revision {revision}, {self.snapshot.count} modules")
+        return True
+
+    def apply_changes(self, modules: list, since: Optional[int]):
+        """
+        Bring search index and module cache of this worker up to date, changes of
+        this worker are already applied, this picks up the ones of other workers.
+        :param modules: All modules.
+        :param since: Revision of previous build, None builds search index from scratch.
+        """
+        if since is None:
+            search_index.build(modules)
+            return
+        ids = set()
+        for module in modules:
+            ids.add(module["id"])
+            if module["revision"] > since:
+                search_index.add(module)
+                module_cache.invalidate(module["id"], module["name"])
+        for module_id in set(search_index.documents) - ids:
+            name = search_index.documents[module_id]["name"]
+            search_index.remove(module_id)
+            module_cache.invalidate(module_id, name)
+
+    async def _rebuild(self):
+        # changes made while building are picked up by one more build
+        while self.dirty:
+            self.dirty = False
+            try:
+                await self.build()
+            except Exception as e:
+                logger.error(f"Error while building catalog snapshot: {e!r}")
+
+    def invalidate(self):
+        """
+        Schedule rebuild, many changes in a row are coalesced into one.
+        """
+        self.dirty = True
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._rebuild())
+
+    def get(self, format: str) -> Optional[tuple]:
+        """
+        Get snapshot bodies.
+        :param format: "json" or "msgpack".
+        :return: Version, body, gzip and brotli or None if not built yet.
+        """
+        if self.snapshot is None:
+            return None
+        return (self.snapshot.version, *self.snapshot.bodies[format])
+
+    async def _refresh_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.invalidate()
+
+    async def start(self, interval: float):
+        """
+        Build snapshot now and rebuild it every interval seconds to pick up changes
+        made by other workers, 0 disables periodic rebuild.
+        :param interval: Interval in seconds.
+        """
+        await self.build()
+        if interval > 0:
+            self.refresher = asyncio.create_task(self._refresh_periodically(interval))
+
+    async def stop(self):
+        tasks = [task for task in (self.refresher, self.task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.refresher = None
+        self.task = None
+
+
+catalog = Catalog()
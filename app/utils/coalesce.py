@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+ROUTES = ("all", "get_diff", "download")
+
+
+class Coalescer:
+    """
+    Single-flight: concurrent calls with the same route and key share one computation.
+    The computation runs as its own task, so a caller going away doesn't cancel it for the others.
+    """
+    def __init__(self):
+        self.routes = set(ROUTES)
+        # (route, key) -> task
+        self.calls = {}
+
+    def configure(self, routes: Optional[list] = None):
+        """
+        :param routes: Routes to coalesce, None for all known routes.
+        """
+        self.routes = set(ROUTES if routes is None else routes)
+
+    def _done(self, call: tuple, task: asyncio.Task):
+        if self.calls.get(call) is task:
+            del self.calls[call]
+        if not task.cancelled() and task.exception() is not None:
+            # retrieved here too, all waiters may be gone
+            logger.debug(f"Coalesced {call[0]} failed: {task.exception()!r}")
+
+    async def do(self, route: str, key, function: Callable[[], Awaitable]):
+        """
+        Run function or wait for the same call already in flight.
+        :param route: Route name, see ROUTES.
+        :param key: Hashable call parameters.
+        :param function: Coroutine function computing the result, result must not be mutated.
+        :return: Result.
+        """
+        if route not in self.routes:
+            return await function()
+
+        call = (route, key)
+        task = self.calls.get(call)
+        if task is None:
+            metrics.coalesce_requests.inc(route, "leader")
+            task = asyncio.ensure_future(function())
+            self.calls[call] = task
+            task.add_done_callback(lambda done: self._done(call, done))
+        else:
+            metrics.coalesce_requests.inc(route, "shared")
+        return await asyncio.shield(task)
+
+
+coalescer = Coalescer()
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from hashlib import sha256
+from typing import Optional
+
+import aiohttp
+
+from app.db.functions import FetchCache
+from app.utils import metrics
+from app.utils.parser import get_githubusercontent
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class FetchResult:
+    url: str
+    hash: str
+    text: Optional[str] = None
+    not_modified: bool = False
+
+
+class ValidatorCache:
+    """
+    Persistent ETag / Last-Modified cache of fetched urls.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.dirty = {}
+
+    async def load(self):
+        """
+        Load validators from database.
+        """
+        self.entries = await FetchCache.get_all_dict()
+        self.dirty = {}
+
+    def get(self, url: str) -> Optional[FetchCache]:
+        return self.entries.get(url)
+
+    def headers(self, url: str) -> dict:
+        """
+        Get conditional request headers for url.
+        :param url: Url.
+        :return: Headers.
+        """
+        entry = self.entries.get(url)
+        if entry is None:
+            return {}
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, url: str, etag: Optional[str], last_modified: Optional[str], hash: str, body: Optional[str]):
+        """
+        Remember validators of fresh response.
+        """
+        if not etag and not last_modified:
+            return
+        entry = FetchCache(url=url, etag=etag, last_modified=last_modified, hash=hash, body=body)
+        self.entries[url] = entry
+        self.dirty[url] = entry
+
+    def forget(self, url: str):
+        """
+        Drop validators of response that wasn't recorded, so it is fetched in full next time.
+        """
+        self.entries.pop(url, None)
+        self.dirty.pop(url, None)
+
+    def pop_dirty(self) -> list:
+        """
+        Get validators changed since load and forget them.
+        :return: FetchCache entries.
+        """
+        dirty = list(self.dirty.values())
+        self.dirty = {}
+        return dirty
+
+    async def flush(self):
+        """
+        Write changed validators to database.
+        """
+        await FetchCache.store_many(self.pop_dirty())
+
+
+class Crawler:
+    """
+    Async crawler for developer repositories, all requests share one pooled session.
+    """
+    def __init__(self, concurrency: int = 32, per_host: int = 8, timeout: float = 15, retries: int = 3):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.validators = ValidatorCache()
+
+    async def start(self):
+        """
+        Open the pooled session.
+        """
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency, limit_per_host=self.per_host
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def close(self):
+        """
+        Close the pooled session.
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def fetch(self, url: str, keep_body: bool = False, conditional: bool = True) -> Optional[FetchResult]:
+        """
+        Get url, retrying on network errors and 429/5xx.
+        Sends cached validators, a 304 is returned without text unless keep_body.
+        :param url: Url.
+        :param keep_body: Keep body in validator cache.
+        :param conditional: Send cached validators.
+        :return: FetchResult or None.
+        """
+        headers = self.validators.headers(url) if conditional else {}
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.semaphore:
+                    async with self.session.get(url, headers=headers) as response:
+                        if response.status == 304 and headers:
+                            metrics.crawler_fetches.inc("not_modified")
+                            entry = self.validators.get(url)
+                            return FetchResult(
+                                url=url,
+                                hash=entry.hash,
+                                text=entry.body if keep_body else None,
+                                not_modified=True,
+                            )
+                        if response.status == 200:
+                            # a bad byte must not abort the whole crawl
+                            text = (await response.read()).decode("utf-8", errors="replace")
+                            body = text.encode()
+                            metrics.crawler_fetches.inc("ok")
+                            metrics.crawler_bytes.inc(amount=len(body))
+                            result = FetchResult(
+                                url=url, hash=sha256(body).hexdigest(), text=text
+                            )
+                            self.validators.store(
+                                url,
+                                response.headers.get("ETag"),
+                                response.headers.get("Last-Modified"),
+                                result.hash,
+                                text if keep_body else None,
+                            )
+                            return result
+                        if response.status not in RETRY_STATUSES:
+                            metrics.crawler_fetches.inc("failed")
+                            return None
+                        logger.warning(f"Got {response.status} for {url}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Error while fetching {url}: {e!r}")
+
+            if attempt < self.retries:
+                metrics.crawler_fetches.inc("retry")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        metrics.crawler_fetches.inc("failed")
+        return None
+
+    async def get_git_modules(self, git: str) -> Optional[list]:
+        """
+        Get module names from full.txt.
+        :param git: Git.
+        :return: Module names or None.
+        """
+        result = await self.fetch(f"{get_githubusercontent(git)}/full.txt", keep_body=True)
+        if result is None or result.text is None:
+            return None
+        modules = [line.replace("\r", "").strip() for line in result.text.split("\n")]
+        return [module for module in modules if module]
+
+    async def get_module(self, module_name: str, git: str, conditional: bool = True) -> Optional[FetchResult]:
+        """
+        Get module code.
+        :param module_name: Module name.
+        :param git: Git.
+        :param conditional: Send cached validators.
+        :return: FetchResult or None.
+        """
+        return await self.fetch(
+            f"{get_githubusercontent(git)}/{module_name}.py", conditional=conditional
+        )
+
+    async def crawl_developer(self, developer) -> tuple:
+        """
+        Get all modules of developer concurrently.
+        :param developer: Developer.
+        :return: Developer and list of (module name, FetchResult).
+        """
+        start = time.perf_counter()
+        modules = await self.get_git_modules(developer.git)
+        if modules is None:
+            return developer, []
+
+        codes = await asyncio.gather(
+            *(self.get_module(module, developer.git) for module in modules)
+        )
+        metrics.crawler_developer_duration.observe(time.perf_counter() - start)
+        return developer, list(zip(modules, codes))
+
+    def crawl(self, developers: list) -> list:
+        """
+        Start crawling all developers concurrently.
+        :param developers: Developers.
+        :return: Tasks, the caller cancels ones left unfinished.
+        """
+        return [asyncio.create_task(self.crawl_developer(developer)) for developer in developers]
+
+
+crawler: Optional[Crawler] = None
+
+
+async def init_crawler(crawler_config: dict) -> None:
+    global crawler
+    crawler_config = dict(crawler_config)
+    backend = crawler_config.pop("backend", "http")
+    mirror_path = crawler_config.pop("mirror_path", "mirrors")
+    if backend == "git":
+        from app.utils.mirror import MirrorCrawler
+
+        crawler = MirrorCrawler(mirror_path, **crawler_config)
+    elif backend == "http":
+        crawler = Crawler(**crawler_config)
+    else:
+        raise ValueError(f"Unknown crawler backend {backend!r}")
+    await crawler.start()
+    logging.info("Crawler started")
+
+
+async def close_crawler() -> None:
+    global crawler
+    if crawler is not None:
+        await crawler.close()
+        crawler = None
+    logging.info("Crawler shutdown")
+
+
+def get_crawler() -> Crawler:
+    return crawler
@@ -1,17 +1,197 @@
-from difflib import unified_diff
+import os
+import re
+from difflib import SequenceMatcher, unified_diff
 
 
-html_diff_template = open("app/utils/diff.html").read()
+html_diff_template = open(os.path.join(os.path.dirname(__file__), "diff.html")).read()
+
+# inputs with more lines in total use the fast diff
+FAST_DIFF_LINES = 5000
+
+HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def intern_lines(a: list, b: list) -> tuple:
+    """
+    Replace lines with ids, equal lines get equal ids.
+    :param a: Old lines.
+    :param b: New lines.
+    :return: Old and new line ids.
+    """
+    ids = {}
+    return (
+        [ids.setdefault(line, len(ids)) for line in a],
+        [ids.setdefault(line, len(ids)) for line in b],
+    )
+
+
+def get_opcodes(a: list, b: list) -> list:
+    """
+    Get SequenceMatcher opcodes for lines, common prefix and suffix are skipped
+    and remaining lines are compared by id instead of by content.
+    :param a: Old lines.
+    :param b: New lines.
+    :return: Opcodes.
+    """
+    prefix = 0
+    limit = min(len(a), len(b))
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and a[-suffix - 1] == b[-suffix - 1]:
+        suffix += 1
+
+    ids_a, ids_b = intern_lines(a[prefix:len(a) - suffix], b[prefix:len(b) - suffix])
+    opcodes = []
+    if prefix:
+        opcodes.append(("equal", 0, prefix, 0, prefix))
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, ids_a, ids_b).get_opcodes():
+        opcodes.append((tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix))
+    if suffix:
+        opcodes.append(("equal", len(a) - suffix, len(a), len(b) - suffix, len(b)))
+    return opcodes
+
+
+# same as difflib.SequenceMatcher.get_grouped_opcodes
+def group_opcodes(opcodes: list, n: int = 3):
+    if not opcodes:
+        opcodes = [("equal", 0, 1, 0, 1)]
+    if opcodes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = opcodes[0]
+        opcodes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if opcodes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = opcodes[-1]
+        opcodes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    nn = n + n
+    group = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal" and i2 - i1 > nn:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+
+def format_range(start: int, stop: int) -> str:
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return str(beginning)
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
 
 
 # https://docs.python.org/3/library/difflib.html#difflib.unified_diff
-def get_diff(a: str, b: str) -> str:
-    diff = unified_diff(a.splitlines(), b.splitlines(), lineterm="")
-    return "\n".join(list(diff))
+def get_diff(a: str, b: str, n: int = 3) -> str:
+    """
+    Get unified diff of code. Small files are diffed by difflib.unified_diff with lineterm="",
+    larger ones skip common prefix and suffix and compare line ids, which may align
+    changes differently than difflib, but hunks apply the same.
+    :param a: Old code.
+    :param b: New code.
+    :param n: Context lines.
+    :return: Diff.
+    """
+    a, b = a.splitlines(), b.splitlines()
+    if len(a) + len(b) <= FAST_DIFF_LINES:
+        return "\n".join(unified_diff(a, b, n=n, lineterm=""))
+    lines = []
+    for group in group_opcodes(get_opcodes(a, b), n):
+        if not lines:
+            lines += ["--- ", "+++ "]
+        first, last = group[0], group[-1]
+        lines.append(
+            f"@@ -{format_range(first[1], last[2])} +{format_range(first[3], last[4])} @@"
+        )
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                lines += [" " + line for line in a[i1:i2]]
+                continue
+            if tag in ("replace", "delete"):
+                lines += ["-" + line for line in a[i1:i2]]
+            if tag in ("replace", "insert"):
+                lines += ["+" + line for line in b[j1:j2]]
+    return "\n".join(lines)
+
+
+def split_hunk(header: str, body: list, size: int) -> list:
+    """
+    Split hunk into hunks of at most size lines with valid headers.
+    :param header: Hunk header.
+    :param body: Hunk lines.
+    :param size: Max lines per hunk.
+    :return: List of hunks as lists of lines.
+    """
+    match = HUNK_RE.match(header)
+    old_line, new_line = int(match.group(1)), int(match.group(3))
+    # empty ranges point to the line before
+    if match.group(2) == "0":
+        old_line += 1
+    if match.group(4) == "0":
+        new_line += 1
+
+    hunks = []
+    for start in range(0, len(body), size):
+        chunk = body[start:start + size]
+        old_count = sum(1 for line in chunk if not line.startswith("+"))
+        new_count = sum(1 for line in chunk if not line.startswith("-"))
+        hunks.append([
+            f"@@ -{format_range(old_line - 1, old_line - 1 + old_count)}"
+            f" +{format_range(new_line - 1, new_line - 1 + new_count)} @@",
+            *chunk,
+        ])
+        old_line += old_count
+        new_line += new_count
+    return hunks
+
+
+def paginate_diff(diff: str, page: int = 1, page_lines: int = 2000) -> tuple:
+    """
+    Cut diff into pages of whole hunks, hunks longer than a page are split.
+    :param diff: Unified diff.
+    :param page: Page number, from 1.
+    :param page_lines: Max lines per page.
+    :return: Diff page and pages count.
+    """
+    lines = diff.split("\n") if diff else []
+    if len(lines) <= page_lines:
+        return diff, 1
+
+    hunks = []
+    for line in lines[2:]:
+        if line.startswith("@@"):
+            hunks.append([line])
+        else:
+            hunks[-1].append(line)
+
+    pages = [[]]
+    for hunk in hunks:
+        parts = [hunk] if len(hunk) <= page_lines else split_hunk(hunk[0], hunk[1:], page_lines - 1)
+        for part in parts:
+            if pages[-1] and len(pages[-1]) + len(part) > page_lines:
+                pages.append([])
+            pages[-1] += part
+
+    if not 1 <= page <= len(pages):
+        return "", len(pages)
+    return "\n".join(lines[:2] + pages[page - 1]), len(pages)
 
 
-def get_html_diff(a: str, b: str) -> str:
-    diff = unified_diff(a.splitlines(), b.splitlines(), lineterm="")
-    diff = "\n".join(list(diff))
-    diff = diff.replace("`", "\`")
+def get_html_diff(diff: str) -> str:
+    """
+    Render unified diff with diff2html.
+    :param diff: Unified diff.
+    :return: Html page.
+    """
+    # escaped for a JS template literal inside a <script> block
+    diff = (
+        diff.replace("\\", "\\\\").replace("`", "\\`").replace("${", "\\${")
+        .replace("</", "<\\/").replace("<!--", "<\\!--")
+    )
     return html_diff_template.replace("{{ diff }}", diff)
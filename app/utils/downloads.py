@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.db.functions import MODULE_FIELDS, Downloads, Module
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadCounter:
+    """
+    Counts downloads in memory and writes them in batches, serves popular modules from memory.
+    """
+    def __init__(self):
+        self.counts = Counter()
+        # window in days -> ranked modules
+        self.rankings = {}
+        self.windows = [1, 7, 30, 0]
+        self.top = 100
+        self.tasks = []
+
+    def hit(self, module_id: int):
+        self.counts[module_id] += 1
+
+    async def flush(self):
+        """
+        Write counted downloads, they are kept for the next flush if writing fails.
+        """
+        counts, self.counts = self.counts, Counter()
+        try:
+            await Downloads.add_counts(dict(counts), datetime.utcnow().date())
+        except Exception as e:
+            logger.error(f"Error while writing downloads: {e!r}")
+            self.counts.update(counts)
+
+    async def build_rankings(self):
+        """
+        Rebuild popular modules of all windows.
+        """
+        today = datetime.utcnow().date()
+        rankings = {}
+        for window in self.windows:
+            since = today - timedelta(days=window - 1) if window > 0 else None
+            ranking = await Downloads.get_ranking(since, self.top)
+            modules = {module["id"]: module for module in await Module.get_many([module_id for module_id, _ in ranking])}
+            rankings[window] = [
+                {**{field: modules[module_id][field] for field in MODULE_FIELDS if field != "git"}, "downloads": downloads}
+                for module_id, downloads in ranking
+                if module_id in modules
+            ]
+        self.rankings = rankings
+
+    def get_popular(self, window: int, offset: int = 0, limit: int = 20) -> Optional[list]:
+        """
+        Get popular modules from last ranking.
+        :param window: Window in days, 0 is all time.
+        :param offset: Offset.
+        :param limit: Limit.
+        :return: Modules with downloads or None for unknown window.
+        """
+        ranking = self.rankings.get(window)
+        if ranking is None:
+            return None
+        return ranking[offset:offset + limit]
+
+    async def _repeat(self, interval: float, function):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await function()
+            except Exception as e:
+                logger.error(f"Error in {function.__name__}: {e!r}")
+
+    async def start(self, flush_interval: float, ranking_interval: float, windows: list, top: int):
+        """
+        Build rankings now and start periodic flushes and rebuilds.
+        :param flush_interval: Seconds between flushes.
+        :param ranking_interval: Seconds between ranking rebuilds.
+        :param windows: Windows in days, 0 is all time.
+        :param top: Modules per ranking.
+        """
+        self.windows = windows
+        self.top = top
+        await self.build_rankings()
+        self.tasks = [
+            asyncio.create_task(self._repeat(flush_interval, self.flush)),
+            asyncio.create_task(self._repeat(ranking_interval, self.build_rankings)),
+        ]
+
+    async def stop(self):
+        """
+        Stop periodic tasks and write remaining downloads.
+        """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        await self.flush()
+
+
+downloads = DownloadCounter()
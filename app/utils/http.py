@@ -0,0 +1,137 @@
+import gzip as gzip_lib
+import re
+
+import brotli as brotli_lib
+from fastapi import Request, Response
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def compress(code, quality: int = 11) -> tuple:
+    """
+    Compress code once for serving.
+    :param code: Code, str or bytes.
+    :param quality: Brotli quality.
+    :return: Gzip and brotli compressed code.
+    """
+    body = code.encode() if isinstance(code, str) else code
+    return (
+        gzip_lib.compress(body, compresslevel=9, mtime=0),
+        brotli_lib.compress(body, mode=brotli_lib.MODE_TEXT, quality=quality),
+    )
+
+
+def accepts_encoding(header: str, encoding: str) -> bool:
+    """
+    Check Accept-Encoding header for encoding with non zero q.
+    :param header: Accept-Encoding header.
+    :param encoding: Encoding.
+    :return: Is accepted.
+    """
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() not in (encoding, "*"):
+            continue
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def etag_matches(header: str, hash: str) -> bool:
+    """
+    Check If-None-Match header against hash, any encoding variant matches.
+    :param header: If-None-Match header.
+    :param hash: Content hash.
+    :return: Is matched.
+    """
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == hash or tag.startswith(hash + "-"):
+            return True
+    return False
+
+
+def parse_range(header: str, size: int):
+    """
+    Parse single byte range.
+    :param header: Range header.
+    :param size: Body size.
+    :return: (start, end) inclusive, None if unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # suffix range, last N bytes
+        length = int(end)
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+def code_response(request: Request, body: bytes, hash: str, gzip: bytes = None, brotli: bytes = None, media_type: str = "text/plain; charset=utf-8", cache_control: str = "no-cache") -> Response:
+    """
+    Build response for module code with ETag, If-None-Match, Range and precompressed bodies.
+    Bodies may be memoryviews, they are sent without copying.
+    :param request: Request.
+    :param body: Encoded code.
+    :param hash: Sha256 of code.
+    :param gzip: Gzip compressed code.
+    :param brotli: Brotli compressed code.
+    :param media_type: Media type.
+    :param cache_control: Cache-Control header.
+    :return: Response.
+    """
+    headers = {
+        "ETag": f'"{hash}"',
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, hash):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or etag_matches(if_range, hash)):
+        byte_range = parse_range(range_header, len(body))
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{len(body)}"
+            return Response(status_code=416, headers=headers)
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+        return Response(
+            content=body[start:end + 1], status_code=206, headers=headers, media_type=media_type
+        )
+
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if brotli is not None and accepts_encoding(accept_encoding, "br"):
+        headers["ETag"] = f'"{hash}-br"'
+        headers["Content-Encoding"] = "br"
+        body = brotli
+    elif gzip is not None and accepts_encoding(accept_encoding, "gzip"):
+        headers["ETag"] = f'"{hash}-gzip"'
+        headers["Content-Encoding"] = "gzip"
+        body = gzip
+
+    return Response(content=body, headers=headers, media_type=media_type)
@@ -0,0 +1,323 @@
+import asyncio
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from app.db.functions import CrawlJobState, Developer, Module, Updates
+from app.utils import metrics
+from app.utils.crawler import get_crawler
+from app.utils.parser import get_parser
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAX_ERRORS = 50
+
+
+@dataclass
+class CrawlJob:
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "running"
+    started_at: datetime = field(default_factory=datetime.now)
+    finished_at: Optional[datetime] = None
+    developers_total: int = 0
+    developers_done: int = 0
+    modules_fetched: int = 0
+    updates_created: int = 0
+    errors: list = field(default_factory=list)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def error(self, message: str):
+        logger.error(message)
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+
+    def get_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "developers_total": self.developers_total,
+            "developers_done": self.developers_done,
+            "modules_fetched": self.modules_fetched,
+            "updates_created": self.updates_created,
+            "errors": self.errors,
+        }
+
+
+class CrawlLock:
+    """
+    Exclusive lock on a file, so only one worker process crawls at a time.
+    """
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.fd = None
+
+    def acquire(self) -> bool:
+        """
+        Try to take lock without waiting.
+        :return: Is taken.
+        """
+        if fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+async def check_updates(job: CrawlJob):
+    """
+    Crawl all developers and create updates for new or changed modules.
+    :param job: Job to report progress to.
+    """
+    all_developers = await Developer.all()
+    module_hashes = await Module.get_hashes()
+    unapproved_updates = await Updates.get_unapproved_names()
+    job.developers_total = len(all_developers)
+
+    crawler = get_crawler()
+    await crawler.validators.load()
+
+    updates = {}
+    tasks = crawler.crawl(all_developers)
+    try:
+        for crawled in asyncio.as_completed(tasks):
+            developer, modules_in_git = await crawled
+
+            changed = []
+            for module, result in modules_in_git:
+                if result is None:
+                    job.error(f"Error while getting module {module} of {developer.username}")
+                    continue
+                job.modules_fetched += 1
+
+                module_hash = module_hashes.get(module)
+
+                if result.not_modified:
+                    if module in unapproved_updates or module_hash == result.hash:
+                        continue
+                    # file is unchanged, but nothing was recorded for it yet
+                    result = await crawler.get_module(module, developer.git, conditional=False)
+                    if result is None:
+                        job.error(f"Error while getting module {module} of {developer.username}")
+                        continue
+
+                if module_hash == result.hash:
+                    logger.info(f"No updates for {module}.")
+                    continue
+
+                changed.append((module, result))
+
+            # parse changed modules of developer in parallel
+            parser = get_parser()
+            infos = await asyncio.gather(
+                *(parser.get_module_info(result.text, result.hash) for _, result in changed),
+                return_exceptions=True,
+            )
+
+            for (module, result), info in zip(changed, infos):
+                module_hash = module_hashes.get(module)
+                if isinstance(info, Exception):
+                    # nothing records this hash, don't let a 304 trigger a refetch next time
+                    crawler.validators.forget(result.url)
+                    metrics.crawler_parse_failures.inc()
+                    job.error(f"Error while getting module info of {module}: {info}")
+                    continue
+
+                if not info:
+                    crawler.validators.forget(result.url)
+                    continue
+
+                if module_hash is not None:
+                    logger.info(f"Update for {module} found.")
+                elif module not in unapproved_updates:
+                    logger.info(f"New module {module} found.")
+                else:
+                    logger.info(f"New module {module} found, but it's already in unapproved updates.")
+
+                updates[module] = dict(
+                    name=module,
+                    description=info["description"],
+                    developer=developer.username,
+                    git=developer.git,
+                    image=info["meta"]["pic"],
+                    banner=info["meta"]["banner"],
+                    commands=info["commands"],
+                    new_code=result.text,
+                    hash=result.hash,
+                )
+                job.updates_created += 1
+
+            job.developers_done += 1
+    finally:
+        # a cancelled or failed job must not leave fetches running
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    await Updates.create_updates(list(updates.values()), crawler.validators.pop_dirty())
+    await Updates.precompute_diffs(list(updates))
+
+
+class JobManager:
+    """
+    Runs crawls in background, one at a time, and keeps recent jobs.
+    Job state is saved to database, so any worker can report or cancel a job.
+    """
+    def __init__(self, keep: int = 20, sync_interval: float = 1):
+        self.keep = keep
+        self.sync_interval = sync_interval
+        self.jobs: "OrderedDict[str, CrawlJob]" = OrderedDict()
+        self.current: Optional[CrawlJob] = None
+        self.scheduler: Optional[asyncio.Task] = None
+        self.lock: Optional[CrawlLock] = None
+
+    async def start(self) -> tuple:
+        """
+        Start crawl job unless one is already running in any worker.
+        :return: Job id, None if the running job is not known yet, and whether it was started now.
+        """
+        if self.current is not None and self.current.status == "running":
+            return self.current.id, False
+        if self.lock is not None and not self.lock.acquire():
+            return await CrawlJobState.get_running_id(), False
+
+        job = CrawlJob()
+        try:
+            # the lock is ours, so jobs still running belong to a dead worker
+            await CrawlJobState.interrupt_running()
+            await CrawlJobState.save_job(job.get_dict())
+        except BaseException:
+            if self.lock is not None:
+                self.lock.release()
+            raise
+        job.task = asyncio.create_task(self._run(job))
+        self.current = job
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.keep:
+            self.jobs.popitem(last=False)
+        return job.id, True
+
+    def set_lock(self, path: str):
+        """
+        Share crawls between worker processes through lock file.
+        :param path: Lock file path.
+        """
+        self.lock = CrawlLock(path)
+
+    async def _sync(self, job: CrawlJob):
+        # save progress and pick up cancel requests of other workers
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                if await CrawlJobState.save_job(job.get_dict()):
+                    job.task.cancel()
+                    return
+            except Exception as e:
+                logger.error(f"Error while saving crawl {job.id}: {e!r}")
+
+    async def _run(self, job: CrawlJob):
+        logger.info(f"Crawl {job.id} started.")
+        sync = asyncio.create_task(self._sync(job))
+        try:
+            await check_updates(job)
+            job.status = "finished"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error(f"Crawl failed: {e!r}")
+        finally:
+            sync.cancel()
+            await asyncio.gather(sync, return_exceptions=True)
+            job.finished_at = datetime.now()
+            try:
+                await CrawlJobState.save_job(job.get_dict())
+                await CrawlJobState.prune(self.keep)
+            except Exception as e:
+                logger.error(f"Error while saving crawl {job.id}: {e!r}")
+            if self.lock is not None:
+                self.lock.release()
+            logger.info(f"Crawl {job.id} {job.status}.")
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        """
+        Get job of any worker.
+        :param job_id: Job id.
+        :return: Job dict or None.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.get_dict()
+        return await CrawlJobState.get_job(job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        Cancel running job, a job of another worker is cancelled on its next sync.
+        :param job_id: Job id.
+        :return: Is job found.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None:
+            if job.status == "running":
+                job.task.cancel()
+            return True
+        if await CrawlJobState.request_cancel(job_id):
+            return True
+        return await CrawlJobState.get_job(job_id) is not None
+
+    async def _schedule(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                job_id, started = await self.start()
+            except Exception as e:
+                logger.error(f"Error while starting scheduled crawl: {e!r}")
+                continue
+            if not started:
+                logger.info(f"Scheduled crawl skipped, {job_id} is still running.")
+
+    def start_scheduler(self, interval: float):
+        """
+        Start crawl every interval seconds, 0 disables schedule.
+        :param interval: Interval in seconds.
+        """
+        if interval > 0:
+            self.scheduler = asyncio.create_task(self._schedule(interval))
+
+    async def stop(self):
+        """
+        Stop scheduler and running job.
+        """
+        tasks = []
+        if self.scheduler is not None:
+            self.scheduler.cancel()
+            tasks.append(self.scheduler)
+            self.scheduler = None
+        if self.current is not None and self.current.status == "running":
+            self.current.task.cancel()
+            tasks.append(self.current.task)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+jobs = JobManager()
@@ -0,0 +1,244 @@
+import bisect
+import functools
+import inspect
+import time
+
+# seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    labels = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        # label values -> value
+        self.values = {}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            # per bucket counts, not cumulative, then sum
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {total!r}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Minimal in-process metrics registry in Prometheus text format.
+    Values are kept per worker process.
+    """
+    def __init__(self):
+        self.enabled = True
+        self.metrics = []
+
+    def add(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.add(Counter(
+    "limoka_http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status")
+))
+http_request_duration = registry.add(Histogram(
+    "limoka_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route")
+))
+http_in_progress = registry.add(Gauge(
+    "limoka_http_requests_in_progress", "HTTP requests being served.", ("method",)
+))
+db_calls = registry.add(Counter(
+    "limoka_db_calls_total", "Calls of database model methods.", ("model", "method")
+))
+db_errors = registry.add(Counter(
+    "limoka_db_errors_total", "Database model methods which raised.", ("model", "method")
+))
+db_duration = registry.add(Histogram(
+    "limoka_db_call_duration_seconds", "Duration of database model methods.", ("model", "method")
+))
+crawler_fetches = registry.add(Counter(
+    "limoka_crawler_fetches_total", "Repository file fetches by result.", ("result",)
+))
+crawler_bytes = registry.add(Counter(
+    "limoka_crawler_bytes_total", "Bytes of fetched repository files."
+))
+crawler_parse_failures = registry.add(Counter(
+    "limoka_crawler_parse_failures_total", "Modules which failed to parse."
+))
+crawler_developer_duration = registry.add(Histogram(
+    "limoka_crawler_developer_duration_seconds", "Time to crawl one developer.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+))
+coalesce_requests = registry.add(Counter(
+    "limoka_coalesced_requests_total", "Coalesced requests, leader computed the result, shared waited for it.",
+    ("route", "result"),
+))
+
+
+def configure(enabled: bool = True):
+    registry.enabled = enabled
+
+
+def instrument(cls):
+    """
+    Class decorator, times async methods defined in class with db metrics.
+    """
+    for name, attribute in list(vars(cls).items()):
+        if isinstance(attribute, (classmethod, staticmethod)):
+            function = attribute.__func__
+        else:
+            function = attribute
+        if name.startswith("_") or not inspect.iscoroutinefunction(function):
+            continue
+        wrapped = timed(cls.__name__, name, function)
+        if isinstance(attribute, classmethod):
+            wrapped = classmethod(wrapped)
+        elif isinstance(attribute, staticmethod):
+            wrapped = staticmethod(wrapped)
+        setattr(cls, name, wrapped)
+    return cls
+
+
+def timed(model: str, method: str, function):
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        if not registry.enabled:
+            return await function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        except BaseException:
+            db_errors.inc(model, method)
+            raise
+        finally:
+            db_calls.inc(model, method)
+            db_duration.observe(time.perf_counter() - start, model, method)
+    return wrapper
+
+
+def get_route_paths(routes) -> dict:
+    """
+    Map routes to their full path templates.
+    Newer FastAPI keeps included routers nested and puts the route with its
+    own, unprefixed, path in scope, so prefixes are resolved here once.
+    :param routes: App routes.
+    :return: Dict of route id to path template.
+    """
+    paths = {}
+    for route in routes:
+        contexts = getattr(route, "effective_route_contexts", None)
+        if contexts is not None:
+            for context in contexts():
+                paths[id(context.original_route)] = context.path_format
+        elif hasattr(route, "path"):
+            paths[id(route)] = route.path
+    return paths
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency per route template, unmatched paths share one label.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not registry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_progress.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_progress.dec(method)
+            route = scope.get("route")
+            if route is None:
+                path = "unmatched"
+            else:
+                if self.paths is None:
+                    self.paths = get_route_paths(scope["app"].routes)
+                path = self.paths.get(id(route)) or getattr(route, "path", "unmatched")
+            http_requests.inc(method, path, status)
+            http_request_duration.observe(time.perf_counter() - start, method, path)
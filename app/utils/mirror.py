@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from hashlib import sha256
+from typing import Optional
+
+from app.utils import metrics
+from app.utils.crawler import FetchResult, ValidatorCache
+
+logger = logging.getLogger(__name__)
+
+GIT_ENV = {"GIT_TERMINAL_PROMPT": "0"}
+
+
+def get_remote_url(git: str) -> str:
+    # https://github.com/vsecoder/hikka_modules/ -> https://github.com/vsecoder/hikka_modules
+    return git.rstrip("/")
+
+
+def get_mirror_name(url: str) -> str:
+    tail = re.sub(r"[^A-Za-z0-9_.-]+", "_", url.rsplit("://", 1)[-1])[-48:]
+    return f"{sha256(url.encode()).hexdigest()[:16]}-{tail}"
+
+
+class MirrorCrawler:
+    """
+    Crawler keeping a shallow bare mirror of every developer repository.
+    One fetch per repository per crawl, files are read from the local object store.
+
+    Validators are reused: a file's blob sha is its etag and the last crawled
+    commit of a repository is stored under "{remote}#HEAD", so only files changed
+    between the crawled and the fetched commit are read.
+    """
+    def __init__(self, path: str = "mirrors", concurrency: int = 32, per_host: int = 8,
+                 timeout: float = 15, retries: int = 3):
+        # per_host is accepted for config compatibility, fetches are limited by concurrency only
+        self.path = path
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.validators = ValidatorCache()
+
+    async def start(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def close(self):
+        pass
+
+    def get_url(self, git: str, path: str) -> str:
+        return f"{get_remote_url(git)}#{path}"
+
+    def open_mirror(self, git: str):
+        """
+        Open mirror of repository, create it if missing.
+        :param git: Git.
+        :return: Repo.
+        """
+        from git import Repo
+
+        url = get_remote_url(git)
+        path = os.path.join(self.path, get_mirror_name(url))
+        if os.path.isdir(path):
+            return Repo(path)
+        repo = Repo.init(path, bare=True)
+        repo.create_remote("origin", url)
+        return repo
+
+    def fetch_mirror(self, git: str):
+        """
+        Fetch default branch of repository with depth 1, no branch name is assumed.
+        :param git: Git.
+        :return: Repo and fetched commit.
+        """
+        repo = self.open_mirror(git)
+        repo.git.fetch(
+            "--depth", "1", "--no-tags", "origin", "HEAD",
+            env=GIT_ENV, kill_after_timeout=self.timeout,
+        )
+        commit = repo.commit("FETCH_HEAD")
+        # keep fetched commit referenced
+        repo.git.update_ref("HEAD", commit.hexsha)
+        return repo, commit
+
+    def get_changed_paths(self, repo, commit, git: str) -> Optional[set]:
+        """
+        Get paths changed since last crawled commit.
+        :return: Paths or None if nothing was crawled yet.
+        """
+        entry = self.validators.get(self.get_url(git, "HEAD"))
+        if entry is None or not entry.etag:
+            return None
+        if entry.etag == commit.hexsha:
+            return set()
+        try:
+            previous = repo.commit(entry.etag)
+            diffs = previous.diff(commit)
+        except Exception as e:
+            logger.warning(f"Can't diff {git} against {entry.etag}: {e!r}")
+            return None
+        paths = set()
+        for diff in diffs:
+            paths.update(path for path in (diff.a_path, diff.b_path) if path)
+        return paths
+
+    def read_file(self, tree, git: str, path: str, changed: Optional[set]) -> Optional[FetchResult]:
+        """
+        Read file from tree, files not in changed paths are answered from validators.
+        :return: FetchResult or None if file is missing.
+        """
+        url = self.get_url(git, path)
+        entry = self.validators.get(url)
+        if changed is not None and path not in changed and entry is not None:
+            metrics.crawler_fetches.inc("not_modified")
+            return FetchResult(url=url, hash=entry.hash, not_modified=True)
+
+        try:
+            blob = tree / path
+        except KeyError:
+            metrics.crawler_fetches.inc("failed")
+            return None
+        if entry is not None and entry.etag == blob.hexsha:
+            metrics.crawler_fetches.inc("not_modified")
+            return FetchResult(url=url, hash=entry.hash, not_modified=True)
+
+        data = blob.data_stream.read()
+        text = data.decode("utf-8", errors="replace")
+        metrics.crawler_fetches.inc("ok")
+        metrics.crawler_bytes.inc(amount=len(data))
+        result = FetchResult(url=url, hash=sha256(text.encode()).hexdigest(), text=text)
+        self.validators.store(url, blob.hexsha, None, result.hash, None)
+        return result
+
+    def crawl_repository(self, git: str) -> Optional[list]:
+        """
+        Fetch repository and read full.txt and changed modules.
+        :param git: Git.
+        :return: List of (module name, FetchResult) or None.
+        """
+        repo, commit = self.fetch_mirror(git)
+        changed = self.get_changed_paths(repo, commit, git)
+        tree = commit.tree
+
+        try:
+            full = (tree / "full.txt").data_stream.read().decode("utf-8", errors="replace")
+        except KeyError:
+            metrics.crawler_fetches.inc("failed")
+            return None
+        modules = [line.replace("\r", "").strip() for line in full.split("\n")]
+        modules = [module for module in modules if module]
+
+        results = [(module, self.read_file(tree, git, f"{module}.py", changed)) for module in modules]
+        head = self.get_url(git, "HEAD")
+        self.validators.store(head, commit.hexsha, None, commit.hexsha, None)
+        return results
+
+    async def crawl_developer(self, developer) -> tuple:
+        """
+        Get all modules of developer from mirror.
+        :param developer: Developer.
+        :return: Developer and list of (module name, FetchResult).
+        """
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.semaphore:
+                    modules = await asyncio.to_thread(self.crawl_repository, developer.git)
+                break
+            except Exception as e:
+                logger.warning(f"Error while fetching {developer.git}: {e!r}")
+            if attempt < self.retries:
+                metrics.crawler_fetches.inc("retry")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        else:
+            metrics.crawler_fetches.inc("failed")
+            return developer, []
+
+        if modules is None:
+            return developer, []
+        metrics.crawler_developer_duration.observe(time.perf_counter() - start)
+        return developer, modules
+
+    def read_module(self, module_name: str, git: str) -> Optional[FetchResult]:
+        repo = self.open_mirror(git)
+        return self.read_file(repo.head.commit.tree, git, f"{module_name}.py", None)
+
+    async def get_module(self, module_name: str, git: str, conditional: bool = True) -> Optional[FetchResult]:
+        """
+        Get module code from mirror as of last fetch.
+        :param module_name: Module name.
+        :param git: Git.
+        :param conditional: Answer unchanged blobs as not modified.
+        :return: FetchResult or None.
+        """
+        if not conditional:
+            # forget validator so the blob is read
+            self.validators.entries.pop(self.get_url(git, f"{module_name}.py"), None)
+        try:
+            return await asyncio.to_thread(self.read_module, module_name, git)
+        except Exception as e:
+            logger.warning(f"Error while reading {module_name} of {git}: {e!r}")
+            return None
+
+    def crawl(self, developers: list) -> list:
+        """
+        Start crawling all developers concurrently.
+        :param developers: Developers.
+        :return: Tasks, the caller cancels ones left unfinished.
+        """
+        return [asyncio.create_task(self.crawl_developer(developer)) for developer in developers]
@@ -1,5 +1,15 @@
 import ast
-import requests
+import asyncio
+import multiprocessing
+import os
+import re
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from hashlib import sha256
+from typing import Optional
+
+from cachetools import LRUCache
 
 
 def get_githubusercontent(git: str):
@@ -13,6 +23,8 @@ def get_githubusercontent(git: str):
     return git
 
 def get_git_modules(git: str):
+    import requests
+
     git = get_githubusercontent(git)
 
     req = requests.get(f"{git}/full.txt")
@@ -24,82 +36,177 @@ def get_git_modules(git: str):
 
 
 def get_module(module_name: str, git: str):
+    import requests
+
     git = get_githubusercontent(git)
     module_name = module_name.replace("\r", "")
     req = requests.get(f"{git}/{module_name}.py")
     return req.text
 
+META_RE = re.compile(r"^# meta ([^:\n]+): ([^\n]*?)\r?$", re.MULTILINE)
+
+
+def get_decorator_name(decorator) -> str:
+    """Имя декоратора без аргументов, например loader.command."""
+    if isinstance(decorator, ast.Call):
+        decorator = decorator.func
+    parts = []
+    while isinstance(decorator, ast.Attribute):
+        parts.append(decorator.attr)
+        decorator = decorator.value
+    if isinstance(decorator, ast.Name):
+        parts.append(decorator.id)
+    return ".".join(reversed(parts))
+
+
 def get_module_info(module_content):
+    # Извлечение мета-информации из комментариев вида "# meta key: value"
     meta_info = {"pic": None, "banner": None}
-    # Извлечение мета-информации из комментариев
-    for line in module_content.split("\n"):
-        # Если строка начинается с "# meta", то это мета-информация
-        if line.startswith("# meta"):
-            # Извлечение ключа и значения
-            key, value = line.replace("# meta ", "").split(": ")
-            meta_info[key] = value
+    meta_info.update(META_RE.findall(module_content))
 
     # Парсинг файла в абстрактное синтаксическое дерево
     tree = ast.parse(module_content)
 
-    def get_decorator_names(decorator_list):
-        """Извлечение имен декораторов из списка."""
-        return [ast.unparse(decorator) for decorator in decorator_list]
-
     result = {}
-    # Проход по всем узлам дерева
-    for node in ast.walk(tree):
-        # Если узел - это определение класса
-        if isinstance(node, ast.ClassDef):
-            # Если не Mod, то пропускаем
-            decorators = get_decorator_names(node.decorator_list)
-            is_tds_mod = [
-                decorator for decorator in decorators if "loader.tds" in decorator
-            ]
-            if "Mod" not in node.name and not is_tds_mod:
+    # Проход только по классам верхнего уровня
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+
+        # Если не Mod и не @loader.tds, то пропускаем
+        if "Mod" not in node.name and not any(
+            "loader.tds" in get_decorator_name(decorator) for decorator in node.decorator_list
+        ):
+            continue
+
+        class_info = {
+            "name": node.name,
+            "description": ast.get_docstring(node),
+            "meta": meta_info,
+            "commands": [],
+        }
+
+        # Проход по методам класса
+        for class_body_node in node.body:
+            if not isinstance(class_body_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+
+            # Если у функции нет декоратора loader.command или cmd в названии, то пропускаем
+            if "cmd" not in class_body_node.name and not any(
+                "command" in get_decorator_name(decorator)
+                for decorator in class_body_node.decorator_list
+            ):
                 continue
 
-            # Извлечение докстринга класса
-            class_docstring = ast.get_docstring(node)
-
-            # Подготовка записи для класса
-            class_info = {
-                "name": node.name,
-                "description": class_docstring,
-                "meta": meta_info,
-                "commands": [],
-            }
-
-            # Проход по элементам класса (методам и атрибутам)
-            for class_body_node in node.body:
-                # Если узел - это обычная функция или асинхронная функция
-                if isinstance(class_body_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                    # Извлечение декораторов
-                    decorators = get_decorator_names(class_body_node.decorator_list)
-
-                    # Если у функции нет декоратора loader.command или cmd в названии, то пропускаем
-                    is_loader_command = [
-                        decorator for decorator in decorators if "command" in decorator
-                    ]
-                    if not is_loader_command and "cmd" not in class_body_node.name:
-                        continue
-
-                    # Извлечение докстринга метода
-                    method_docstring = ast.get_docstring(class_body_node)
-
-                    # Добавление информации о методе
-                    class_info["commands"].append(
-                        {class_body_node.name: method_docstring}
-                    )
-
-            # Записываем результат
-            result = class_info
+            class_info["commands"].append(
+                {class_body_node.name: ast.get_docstring(class_body_node)}
+            )
+
+        # Записываем результат
+        result = class_info
 
     return result
 
 
+def _alarm(signum, frame):
+    raise TimeoutError("Module parsing timed out")
+
+
+def get_module_info_limited(module_content, timeout: float):
+    """
+    get_module_info for pool workers, interrupted after timeout seconds.
+    """
+    if not hasattr(signal, "setitimer"):
+        return get_module_info(module_content)
+    signal.signal(signal.SIGALRM, _alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return get_module_info(module_content)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class ModuleParser:
+    """
+    Parses modules in a process pool, results are memoized by code sha256.
+    """
+    def __init__(self, workers: int = 0, max_size: int = 1024 * 1024, timeout: float = 10, cache_size: int = 4096):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cache = LRUCache(maxsize=cache_size)
+        self.pool: Optional[ProcessPoolExecutor] = None
+
+    def get_pool(self) -> ProcessPoolExecutor:
+        # started lazily, so startup does not wait for workers
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    async def get_module_info(self, module_content: str, hash: str = None) -> dict:
+        """
+        Get module info.
+        :param module_content: Code.
+        :param hash: Sha256 of code, computed if not given.
+        :return: Module info, raises on invalid or too big modules.
+        """
+        if len(module_content) > self.max_size:
+            raise ValueError(f"Module is bigger than {self.max_size} bytes")
+        if hash is None:
+            hash = sha256(module_content.encode()).hexdigest()
+
+        cached = self.cache.get(hash)
+        if isinstance(cached, Exception):
+            raise cached
+        if cached is not None:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        try:
+            # the worker interrupts itself, time spent in queue is not limited
+            result = await loop.run_in_executor(
+                self.get_pool(), get_module_info_limited, module_content, self.timeout
+            )
+        except BrokenProcessPool:
+            self.close()
+            raise
+        except (SyntaxError, ValueError) as e:
+            # invalid code fails the same way every time, timeouts may pass on a less busy host
+            self.cache[hash] = e.with_traceback(None)
+            raise
+        self.cache[hash] = result
+        return result
+
+
+module_parser: Optional[ModuleParser] = None
+
+
+def init_parser(parser_config: dict) -> None:
+    global module_parser
+    module_parser = ModuleParser(**parser_config)
+
+
+def close_parser() -> None:
+    global module_parser
+    if module_parser is not None:
+        module_parser.close()
+        module_parser = None
+
+
+def get_parser() -> ModuleParser:
+    return module_parser
+
+
 if __name__ == "__main__":
     import json
+    import requests
     print(json.dumps(
         get_module_info(
             requests.get(
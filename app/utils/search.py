@@ -0,0 +1,169 @@
+import bisect
+import heapq
+import logging
+import math
+import re
+from collections import defaultdict
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+# weight of a term occurrence per field
+FIELD_WEIGHTS = {
+    "name": 5.0,
+    "command": 3.0,
+    "developer": 2.0,
+    "description": 1.0,
+    "doc": 0.5,
+}
+# score multiplier of terms matched only by prefix
+PREFIX_WEIGHT = 0.5
+MAX_PREFIX_TERMS = 64
+
+
+def tokenize(text) -> list:
+    if not text:
+        return []
+    return TOKEN_RE.findall(str(text).lower())
+
+
+class SearchIndex:
+    """
+    In-memory inverted index over module name, description, developer and commands.
+    """
+    def __init__(self):
+        # term -> {module id: weighted term frequency}
+        self.postings = defaultdict(dict)
+        # module id -> terms, to remove module from postings
+        self.module_terms = {}
+        self.documents = {}
+        self._sorted_terms = None
+
+    def get_terms(self, module: dict) -> dict:
+        terms = defaultdict(float)
+        fields = [
+            ("name", module.get("name")),
+            ("developer", module.get("developer")),
+            ("description", module.get("description")),
+        ]
+        for command in module.get("commands") or []:
+            for command_name, doc in command.items():
+                fields.append(("command", command_name))
+                fields.append(("doc", doc))
+
+        for field, text in fields:
+            for term in tokenize(text):
+                terms[term] += FIELD_WEIGHTS[field]
+        return terms
+
+    def add(self, module: dict):
+        """
+        Add or replace module in index.
+        :param module: Module dict with id, name, description, developer and commands.
+        """
+        module_id = module["id"]
+        self.remove(module_id)
+
+        terms = self.get_terms(module)
+        for term, weight in terms.items():
+            if term not in self.postings:
+                self._sorted_terms = None
+            self.postings[term][module_id] = weight
+        self.module_terms[module_id] = list(terms)
+        self.documents[module_id] = {
+            "id": module_id,
+            "name": module.get("name"),
+            "description": module.get("description"),
+            "developer": module.get("developer"),
+        }
+
+    def remove(self, module_id: int):
+        """
+        Remove module from index.
+        :param module_id: Module id.
+        """
+        for term in self.module_terms.pop(module_id, []):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(module_id, None)
+            if not posting:
+                del self.postings[term]
+                self._sorted_terms = None
+        self.documents.pop(module_id, None)
+
+    def build(self, modules: list):
+        """
+        Rebuild index from scratch.
+        :param modules: Module dicts.
+        """
+        self.postings = defaultdict(dict)
+        self.module_terms = {}
+        self.documents = {}
+        self._sorted_terms = None
+        for module in modules:
+            self.add(module)
+        logging.info(f"Search index built, {len(self.documents)} modules")
+
+    def expand_prefix(self, prefix: str) -> list:
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        terms = []
+        for term in self._sorted_terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def idf(self, term: str) -> float:
+        return math.log(1 + len(self.documents) / len(self.postings[term]))
+
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> tuple:
+        """
+        Find modules matching all query terms, the last term also matches as prefix.
+        :param query: Query.
+        :param offset: Offset.
+        :param limit: Limit.
+        :return: Total count and page of modules with scores.
+        """
+        query_terms = tokenize(query)
+        if not query_terms:
+            return 0, []
+
+        scores = None
+        for position, query_term in enumerate(query_terms):
+            term_scores = defaultdict(float)
+            if query_term in self.postings:
+                idf = self.idf(query_term)
+                for module_id, weight in self.postings[query_term].items():
+                    term_scores[module_id] += weight * idf
+            if position == len(query_terms) - 1:
+                for term in self.expand_prefix(query_term):
+                    if term == query_term:
+                        continue
+                    idf = self.idf(term) * PREFIX_WEIGHT
+                    for module_id, weight in self.postings[term].items():
+                        term_scores[module_id] += weight * idf
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    module_id: score + term_scores[module_id]
+                    for module_id, score in scores.items()
+                    if module_id in term_scores
+                }
+            if not scores:
+                return 0, []
+
+        ranked = heapq.nsmallest(
+            offset + limit, scores.items(), key=lambda item: (-item[1], item[0])
+        )
+        page = [
+            {**self.documents[module_id], "score": round(score, 4)}
+            for module_id, score in ranked[offset:]
+        ]
+        return len(scores), page
+
+
+search_index = SearchIndex()
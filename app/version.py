@@ -1,19 +1,79 @@
+import asyncio
+import logging
 import os
-import git
+from typing import Optional
 
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
-try:
-    branch = git.Repo(
-        path=os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-    ).active_branch.name
-except Exception:
-    branch = "main"
 
+def get_branch():
+    # gitpython is slow to import, it is only needed for build info
+    import git
 
-def get_info(branch):
-    repo = git.Repo()
-    build = repo.heads[0].commit.hexsha
-    diff = repo.git.log([f"HEAD..origin/{branch}", "--oneline"])
-    upd = "Update required" if diff else "Up-to-date"
+    try:
+        return git.Repo(path=ROOT).active_branch.name
+    except Exception:
+        return "main"
+
+
+def get_fallback_info(branch):
+    # no git checkout, e.g. in docker image
+    return {"build": os.environ.get("LIMOKA_BUILD", "unknown"), "upd": "Unknown", "branch": branch}
+
+
+def get_info(branch=None):
+    import git
+
+    if branch is None:
+        branch = get_branch()
+    try:
+        repo = git.Repo(path=ROOT)
+        build = repo.head.commit.hexsha
+    except Exception:
+        return get_fallback_info(branch)
+
+    try:
+        diff = repo.git.log([f"HEAD..origin/{branch}", "--oneline"])
+        upd = "Update required" if diff else "Up-to-date"
+    except git.GitCommandError:
+        upd = "Unknown"
 
     return {"build": build, "upd": upd, "branch": branch}
+
+
+class BuildInfo:
+    """
+    Build info computed off the event loop and served from memory.
+    """
+    def __init__(self):
+        self.info = get_fallback_info("main")
+        self.task: Optional[asyncio.Task] = None
+
+    async def refresh(self):
+        try:
+            self.info = await asyncio.to_thread(get_info)
+        except Exception as e:
+            logging.error(f"Error while getting build info: {e!r}")
+
+    async def _refresh_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh()
+
+    async def start(self, interval: float):
+        """
+        Compute build info now and refresh it every interval seconds, 0 disables refresh.
+        :param interval: Interval in seconds.
+        """
+        await self.refresh()
+        if interval > 0:
+            self.task = asyncio.create_task(self._refresh_periodically(interval))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+
+build_info = BuildInfo()
@@ -0,0 +1,98 @@
+"""
+Local stand-in for raw.githubusercontent.com serving synthetic developer repositories.
+"""
+import random
+from hashlib import sha256
+
+from aiohttp import web
+
+
+def make_module(name: str, version: int = 1, commands: int = 5, lines: int = 300) -> str:
+    """
+    Generate module source, deterministic for name and version.
+    :param name: Module name.
+    :param version: Version, changes description and some of the body.
+    :param commands: Commands count.
+    :param lines: Approximate lines of filler code.
+    :return: Source.
+    """
+    rng = random.Random(f"{name}:{version}")
+    methods = []
+    for i in range(commands):
+        methods.append(
+            f"    @loader.command()\n"
+            f"    async def {name}c{i}cmd(self, message):\n"
+            f'        """Command {i} of {name}, does thing number {rng.randint(0, 1000)}"""\n'
+            f"        await utils.answer(message, self.strings['reply_{i}'])\n"
+        )
+    filler = []
+    for i in range(lines // 3):
+        # most lines are stable between versions so diffs stay realistic
+        value = rng.randint(0, 10 ** 6) if i % 10 == version % 10 else i * 7
+        filler.append(
+            f"    def helper_{i}(self, value):\n"
+            f"        return value * {value} + {i}\n"
+        )
+    return (
+        f"# meta pic: https://example.com/{name}.png\n"
+        f"# meta banner: https://example.com/{name}_banner.png\n"
+        f"from .. import loader, utils\n\n\n"
+        f"@loader.tds\n"
+        f"class {name.capitalize()}Mod(loader.Module):\n"
+        f'    """Synthetic module {name}, version {version}"""\n\n'
+        + "\n".join(methods) + "\n"
+        + "\n".join(filler)
+    )
+
+
+class FakeGitHub:
+    """
+    Serves {developer}/main/full.txt and {developer}/main/{module}.py with ETags.
+    """
+    def __init__(self):
+        self.files = {}
+        self.requests = 0
+        self.runner = None
+        self.port = None
+
+    def add_developer(self, developer: str, modules: dict):
+        """
+        Add or replace developer repository.
+        :param developer: Developer username.
+        :param modules: Dict of module name to source.
+        """
+        self.files[f"{developer}/main/full.txt"] = "\n".join(modules) + "\n"
+        for name, source in modules.items():
+            self.files[f"{developer}/main/{name}.py"] = source
+
+    def set_module(self, developer: str, name: str, source: str):
+        self.files[f"{developer}/main/{name}.py"] = source
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = self.files.get(request.match_info["path"])
+        if body is None:
+            return web.Response(status=404, text="404: Not Found")
+        etag = '"' + sha256(body.encode()).hexdigest()[:16] + '"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(text=body, headers={"ETag": etag})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Start server.
+        :return: Base url.
+        """
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,90 @@
+"""
+Startup time benchmark.
+
+Measures, each in a fresh interpreter:
+- import of the app (what every worker pays),
+- boot migration step on an up to date database (schema check only),
+- forced migration step (what every boot used to run).
+
+Usage: python benchmarks/startup.py [--runs 5] [--output benchmarks/results/startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+CONFIG = """
+[web]
+host = "127.0.0.1"
+port = 8000
+
+[database]
+models = ["app.db.functions", "aerich.models"]
+file_name = "{db}"
+
+[token]
+main = "benchmark"
+"""
+
+MIGRATE = """
+import asyncio, sys
+from app.__main__ import migrate
+from app.config import load_config
+asyncio.run(migrate(load_config("config.toml"), check=sys.argv[1] == "check"))
+"""
+
+
+def run_python(code: str, *args, cwd: str) -> float:
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", code, *args],
+        cwd=cwd, env=env, check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def measure(runs: int, code: str, *args, cwd: str) -> dict:
+    times = [run_python(code, *args, cwd=cwd) for _ in range(runs)]
+    return {
+        "runs": runs,
+        "median": round(statistics.median(times), 4),
+        "min": round(min(times), 4),
+        "max": round(max(times), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app startup.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "startup.json"))
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cwd:
+        with open(os.path.join(cwd, "config.toml"), "w") as f:
+            f.write(CONFIG.format(db=os.path.join(cwd, "db.sqlite3")))
+        # create schema once
+        run_python(MIGRATE, "force", cwd=cwd)
+
+        results = {
+            "python": sys.version.split()[0],
+            "import": measure(arguments.runs, "import app.dispatcher", cwd=cwd),
+            "migrate_check": measure(arguments.runs, MIGRATE, "check", cwd=cwd),
+            "migrate_force": measure(arguments.runs, MIGRATE, "force", cwd=cwd),
+        }
+
+    os.makedirs(os.path.dirname(arguments.output), exist_ok=True)
+    with open(arguments.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
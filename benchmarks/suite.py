@@ -0,0 +1,307 @@
+"""
+Offline benchmark suite.
+
+Seeds a fresh sqlite database with developers, modules and users, serves their
+repositories from a local fake GitHub, starts the api in a subprocess and measures:
+- /api/module/all, full listing and keyset pages,
+- raw module downloads by id and by developer link,
+- get_diff of pending updates,
+- check_updates crawl, cold (no validators) and warm (all files answer 304).
+
+Usage: python benchmarks/suite.py [--developers 20] [--modules 20] [--users 10000]
+       [--requests 2000] [--concurrency 32] [--workers 1] [--baseline old.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from hashlib import sha256
+
+import aiohttp
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakegh import FakeGitHub, make_module  # noqa: E402
+
+TOKEN = "benchmark"
+
+CONFIG = """
+[web]
+host = "127.0.0.1"
+port = {port}
+workers = {workers}
+
+[database]
+models = ["app.db.functions", "aerich.models"]
+file_name = "{db}"
+
+[token]
+main = "{token}"
+
+[crawler]
+interval = 0
+"""
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def get_free_port() -> int:
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def summarize(latencies: list, elapsed: float, errors: int) -> dict:
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p50_ms": round(quantiles[49] * 1000, 3),
+        "p90_ms": round(quantiles[89] * 1000, 3),
+        "p99_ms": round(quantiles[98] * 1000, 3),
+    }
+
+
+async def load(session: aiohttp.ClientSession, make_url, requests: int, concurrency: int, headers: dict = None) -> dict:
+    """
+    Send requests with fixed concurrency.
+    :param make_url: Function of request number to url.
+    :return: Latency and throughput stats.
+    """
+    latencies = []
+    errors = 0
+    numbers = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for number in numbers:
+            start = time.perf_counter()
+            async with session.get(make_url(number), headers=headers) as response:
+                await response.read()
+                if response.status >= 400:
+                    errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+async def seed(config_file: str, gh: FakeGitHub, base_url: str, arguments) -> dict:
+    """
+    Create schema and seed developers, modules and users, repositories get the same code.
+    :return: Developer username to module names.
+    """
+    from app.__main__ import migrate
+    from app.config import load_config
+    from app.db import close_orm, init_orm
+    from app.db.functions import Developer, Module, User
+
+    config = load_config(config_file)
+    await migrate(config, check=False)
+    await init_orm(config.database.get_tortoise_config())
+
+    repositories = {}
+    modules = []
+    for d in range(arguments.developers):
+        username = f"dev{d}"
+        await Developer.create_developer(d, username, f"{base_url}/{username}")
+        sources = {f"d{d}m{m}": make_module(f"d{d}m{m}") for m in range(arguments.modules)}
+        gh.add_developer(username, sources)
+        repositories[username] = list(sources)
+        for name, source in sources.items():
+            modules.append(dict(
+                name=name,
+                description=f"Synthetic module {name}, version 1",
+                developer=username,
+                hash=sha256(source.encode()).hexdigest(),
+                git=f"{base_url}/{username}/main/{name}.py",
+                image=None,
+                banner=None,
+                commands=[],
+                code=source,
+            ))
+    for start in range(0, len(modules), 500):
+        await Module.create_modules(modules[start:start + 500])
+    await User.create_users(list(range(arguments.users)))
+    await close_orm()
+    return repositories
+
+
+async def wait_ready(session: aiohttp.ClientSession, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Api process exited")
+        try:
+            async with session.get("/") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError("Api did not start")
+
+
+async def crawl(session: aiohttp.ClientSession) -> dict:
+    headers = {"token": TOKEN}
+    start = time.perf_counter()
+    async with session.get("/api/module/check_updates/", headers=headers) as response:
+        job_id = (await response.json())["job_id"]
+    while True:
+        async with session.get(f"/api/module/check_updates/{job_id}", headers=headers) as response:
+            job = await response.json()
+        if job["status"] != "running":
+            break
+        await asyncio.sleep(0.05)
+    return {
+        "seconds": round(time.perf_counter() - start, 3),
+        "status": job["status"],
+        "modules_fetched": job["modules_fetched"],
+        "updates_created": job["updates_created"],
+        "errors": len(job["errors"]),
+    }
+
+
+async def run(arguments) -> dict:
+    rng = random.Random(arguments.seed)
+    results = {}
+    gh = FakeGitHub()
+    base_url = await gh.start()
+
+    with tempfile.TemporaryDirectory() as cwd:
+        port = get_free_port()
+        config_file = os.path.join(cwd, "config.toml")
+        with open(config_file, "w") as f:
+            f.write(CONFIG.format(
+                port=port, workers=arguments.workers, db=os.path.join(cwd, "db.sqlite3"), token=TOKEN
+            ))
+
+        os.chdir(cwd)
+        start = time.perf_counter()
+        repositories = await seed(config_file, gh, base_url, arguments)
+        results["seed_seconds"] = round(time.perf_counter() - start, 3)
+        modules = [(developer, name) for developer, names in repositories.items() for name in names]
+
+        process = subprocess.Popen(
+            [sys.executable, "-m", "app", "-c", config_file],
+            cwd=cwd, env={**os.environ, "PYTHONPATH": ROOT},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            async with aiohttp.ClientSession(f"http://127.0.0.1:{port}") as session:
+                start = time.perf_counter()
+                await wait_ready(session, process)
+                results["startup_seconds"] = round(time.perf_counter() - start, 3)
+
+                requests, concurrency = arguments.requests, arguments.concurrency
+                results["all"] = await load(
+                    session, lambda i: "/api/module/all", max(requests // 10, 1), concurrency
+                )
+                results["all_page"] = await load(
+                    session,
+                    lambda i: f"/api/module/all?limit=100&after_id={rng.randrange(len(modules))}",
+                    requests, concurrency,
+                )
+                results["download_by_id"] = await load(
+                    session, lambda i: f"/api/module/download/{rng.randrange(len(modules)) + 1}",
+                    requests, concurrency,
+                )
+                results["download_by_link"] = await load(
+                    session, lambda i: "/api/module/{}/{}.py".format(*rng.choice(modules)),
+                    requests, concurrency,
+                )
+
+                # change a share of modules upstream
+                changed = rng.sample(modules, max(int(len(modules) * arguments.changed), 1))
+                for developer, name in changed:
+                    gh.set_module(developer, name, make_module(name, version=2))
+                results["crawl_cold"] = await crawl(session)
+                results["crawl_warm"] = await crawl(session)
+
+                async with session.get("/api/module/get_unapproved_updates/", headers={"token": TOKEN}) as response:
+                    update_ids = [update["id"] for update in await response.json()]
+                if update_ids:
+                    results["get_diff"] = await load(
+                        session, lambda i: f"/api/module/get_diff/{rng.choice(update_ids)}/text",
+                        requests, concurrency,
+                    )
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+            os.chdir(ROOT)
+
+    await gh.stop()
+    return results
+
+
+def compare(results: dict, baseline: dict):
+    """
+    Print change of main metrics against baseline results.
+    """
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not isinstance(current, dict) or not isinstance(previous, dict):
+            continue
+        for metric in ("rps", "p50_ms", "p99_ms", "seconds"):
+            if metric in current and previous.get(metric):
+                change = (current[metric] - previous[metric]) / previous[metric] * 100
+                print(f"{name:20} {metric:8} {previous[metric]:>10} -> {current[metric]:>10} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run offline benchmark suite.")
+    parser.add_argument("--developers", type=int, default=20)
+    parser.add_argument("--modules", type=int, default=20, help="modules per developer")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--changed", type=float, default=0.1, help="share of modules changed before crawl")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "suite.json"))
+    parser.add_argument("--baseline", help="results file to compare with")
+    arguments = parser.parse_args()
+
+    output = os.path.abspath(arguments.output)
+    results = {
+        "commit": get_commit(),
+        "python": sys.version.split()[0],
+        "params": {
+            key: getattr(arguments, key)
+            for key in ("developers", "modules", "users", "requests", "concurrency", "workers", "changed", "seed")
+        },
+        **asyncio.run(run(arguments)),
+    }
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if arguments.baseline:
+        with open(arguments.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()